@@ -0,0 +1,163 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+from contextlib import asynccontextmanager
+
+import uvicorn
+from fastapi import FastAPI, File, HTTPException, Query, UploadFile
+from fastapi.responses import JSONResponse, StreamingResponse
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.jobs import JobManager
+from utils.pipeline import DocumentPipeline, SUPPORTED_EXTENSIONS
+
+logger = logging.getLogger(__name__)
+
+
+def create_app(pipeline=None, concurrency=4, max_pending=32, retry_after=5):
+    """
+    Build the FastAPI application
+
+    Args:
+        pipeline: DocumentPipeline to serve, by default one with cross-request batching
+        concurrency: Documents processed at once
+        max_pending: Jobs queued or running before requests get HTTP 429
+        retry_after: Seconds suggested to clients in the Retry-After header of a 429
+    """
+    if pipeline is None:
+        pipeline = DocumentPipeline(
+            lang=os.environ.get("OCR_LANG", "ru"),
+            llm_api_key=os.environ.get("OPENAI_API_KEY"),
+            layout_backend=os.environ.get("LAYOUT_BACKEND", "torch"),
+            batch_wait=0.02
+        )
+    jobs = JobManager(pipeline, workers=concurrency, max_pending=max_pending)
+    ready = threading.Event()
+    warmup_error = []
+
+    def warmup():
+        try:
+            pipeline.warmup()
+        except Exception as e:
+            logger.exception("Pipeline warmup failed")
+            warmup_error.append(str(e) or type(e).__name__)
+        else:
+            ready.set()
+
+    @asynccontextmanager
+    async def lifespan(app):
+        # Models load in the background, so the health check answers right away
+        threading.Thread(target=warmup, name="pipeline-warmup", daemon=True).start()
+        yield
+        await asyncio.to_thread(jobs.close, cancel=True)
+        pipeline.close()
+
+    app = FastAPI(title="Banking Document OCR", lifespan=lifespan)
+    app.state.jobs = jobs
+
+    def get_job(job_id):
+        job = jobs.get(job_id)
+        if job is None:
+            raise HTTPException(404, f"Unknown job {job_id}")
+        return job
+
+    @app.get("/healthz")
+    def health():
+        return {"ready": ready.is_set(), "pending": jobs.pending(), "max_pending": jobs.max_pending}
+
+    @app.get("/ready")
+    def readiness():
+        """200 once the models are loaded, 503 while warming up or after a failed warmup"""
+        if ready.is_set():
+            return {"status": "ready"}
+        if warmup_error:
+            return JSONResponse({"status": "failed", "error": warmup_error[0]}, status_code=503)
+        return JSONResponse({"status": "warming up"}, status_code=503)
+
+    @app.post("/v1/documents", status_code=202)
+    async def submit_document(file: UploadFile = File(...),
+                              wait: bool = Query(False, description="Answer with the result instead of a job id"),
+                              timeout: float = Query(300.0, description="Seconds to wait when wait=true")):
+        if not file.filename.lower().endswith(SUPPORTED_EXTENSIONS):
+            raise HTTPException(415, f"Unsupported file type, expected one of {', '.join(SUPPORTED_EXTENSIONS)}")
+
+        with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(file.filename)[1].lower()) as tmp:
+            tmp.write(await file.read())
+        try:
+            job = jobs.submit(tmp.name, filename=file.filename, delete_file=True)
+        except RuntimeError:
+            os.unlink(tmp.name)
+            raise HTTPException(503, "Server is shutting down")
+        if job is None:
+            os.unlink(tmp.name)
+            return JSONResponse({"detail": "Too many documents in progress, retry later"}, status_code=429,
+                                headers={"Retry-After": str(retry_after)})
+
+        if not wait:
+            return {"job_id": job.id, "status": job.status}
+
+        status = await asyncio.to_thread(job.wait, timeout)
+        if not job.is_finished:
+            # The job keeps running and can be polled with its id
+            return {"job_id": job.id, "status": status}
+        return JSONResponse(job.progress(), status_code=200 if status == "done" else 500)
+
+    @app.get("/v1/documents/{job_id}")
+    def get_document(job_id: str):
+        return get_job(job_id).progress()
+
+    @app.get("/v1/documents/{job_id}/events")
+    async def document_events(job_id: str):
+        """Server-sent events: page progress as it happens, ending with done, failed or cancelled"""
+        job = get_job(job_id)
+
+        async def stream():
+            async for event in job.aevents():
+                yield f"event: {event['event']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+        return StreamingResponse(stream(), media_type="text/event-stream")
+
+    @app.delete("/v1/documents/{job_id}")
+    def cancel_document(job_id: str):
+        job = jobs.cancel(job_id)
+        if job is None:
+            raise HTTPException(404, f"Unknown job {job_id}")
+        return {"job_id": job.id, "status": job.status}
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description='HTTP API for document processing')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--concurrency', type=int, default=4, help='Documents processed at once')
+    parser.add_argument('--max-pending', type=int, default=32,
+                        help='Queued or running documents before requests get HTTP 429')
+    parser.add_argument('--batch-wait', type=float, default=0.02,
+                        help='Seconds a page waits for pages of other requests to share its batch')
+    parser.add_argument('--layout-backend', default=os.environ.get("LAYOUT_BACKEND", "torch"),
+                        choices=['torch', 'torch-int8', 'onnx'])
+    parser.add_argument('--ocr-workers', type=int, default=0)
+    args = parser.parse_args()
+
+    pipeline = DocumentPipeline(
+        lang=os.environ.get("OCR_LANG", "ru"),
+        llm_api_key=os.environ.get("OPENAI_API_KEY"),
+        layout_backend=args.layout_backend,
+        ocr_workers=args.ocr_workers,
+        batch_wait=args.batch_wait
+    )
+    app = create_app(pipeline, concurrency=args.concurrency, max_pending=args.max_pending)
+    uvicorn.run(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,7 @@ import json
 import os
 import sys
 import tempfile
+import threading
 
 import streamlit as st
 from PIL import Image
@@ -9,16 +10,49 @@ from PIL import Image
 # Add parent directory to path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from utils.jobs import JobManager
 from utils.pipeline import DocumentPipeline
 
 
 # Initialize the pipeline
 @st.cache_resource
 def load_pipeline():
-    return DocumentPipeline(
+    pipeline = DocumentPipeline(
         lang='ru',  # or 'kz' for Kazakh
         llm_api_key=os.environ.get("OPENAI_API_KEY")
     )
+    # Load models in the background so the UI and health check come up right away
+    threading.Thread(target=pipeline.warmup, name="pipeline-warmup", daemon=True).start()
+    return pipeline
+
+
+@st.cache_resource
+def load_job_manager():
+    # Jobs outlive script reruns, so a click elsewhere does not restart a running document
+    return JobManager(load_pipeline(), workers=1)
+
+
+def show_progress(job, progress_bar, status_text, ocr_text):
+    """Redraw page progress and the OCR text recognized so far"""
+    progress = job.progress()
+    total = progress["pages_total"] or max(progress["pages_rendered"], 1)
+    # Each page counts for OCR and LayoutLMv3, the LLM call for one more step
+    steps = progress["pages_ocr_done"] + progress["pages_layout_done"] + progress["llm_done"]
+    progress_bar.progress(min(steps / (2 * total + 1), 1.0))
+
+    if progress["status"] == "queued":
+        status_text.info("Waiting for the previous document...")
+    elif progress["pages_layout_done"] < total:
+        status_text.info(f"Pages: {progress['pages_rendered']} rendered, {progress['pages_ocr_done']} OCR, "
+                         f"{progress['pages_layout_done']} layout of {total}")
+    elif not progress["llm_done"]:
+        status_text.info("Extracting fields with the LLM...")
+
+    with ocr_text.container():
+        for page in progress["pages"]:
+            if page.get("ocr_done"):
+                with st.expander(f"Page {page['page']} text"):
+                    st.text(page["text"])
 
 
 st.set_page_config(
@@ -27,6 +61,9 @@ st.set_page_config(
     layout="wide"
 )
 
+load_pipeline()
+jobs = load_job_manager()
+
 st.title("🏦 Banking Document OCR")
 st.markdown("""
 This application uses advanced OCR technology to extract information from banking documents.
@@ -52,38 +89,46 @@ with col1:
                                      type=["jpg", "jpeg", "png", "pdf"])
 
     if uploaded_file is not None:
-        # Save the file temporarily
-        with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(uploaded_file.name)[1]) as tmp:
-            tmp.write(uploaded_file.getvalue())
-            tmp_path = tmp.name
-
         # Display the image
-        if tmp_path.lower().endswith(('.png', '.jpg', '.jpeg')):
-            st.image(tmp_path, caption="Uploaded Document", use_column_width=True)
+        if uploaded_file.name.lower().endswith(('.png', '.jpg', '.jpeg')):
+            st.image(uploaded_file.getvalue(), caption="Uploaded Document", use_column_width=True)
         else:
-                        st.info("PDF file uploaded. All pages will be processed.")
+            st.info("PDF file uploaded. All pages will be processed.")
 
         # Process button
         if st.button("Process Document"):
-            with st.spinner("Processing document..."):
-                try:
-                    # Initialize pipeline with the selected language
-                    pipeline = load_pipeline()
-
-                    # Process the document
-                    result = pipeline.process(tmp_path)
-
-                    # Store results in session state
-                    st.session_state.result = result
-                    st.session_state.processing_complete = True
-
-                    # Show success
-                    st.success("Document processed successfully!")
-                except Exception as e:
-                    st.error(f"Error processing document: {str(e)}")
-                finally:
-                    # Clean up the temp file
-                    os.unlink(tmp_path)
+            # Save the file temporarily, the job deletes it when it is finished
+            with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(uploaded_file.name)[1]) as tmp:
+                tmp.write(uploaded_file.getvalue())
+            job = jobs.submit(tmp.name, filename=uploaded_file.name, delete_file=True)
+            st.session_state.job_id = job.id
+            st.session_state.processing_complete = False
+
+    job = jobs.get(st.session_state.get("job_id"))
+    if job is not None and not st.session_state.get("processing_complete", False):
+        if not job.is_finished and st.button("Cancel"):
+            job.cancel()
+
+        progress_bar = st.progress(0.0)
+        status_text = st.empty()
+        ocr_text = st.empty()
+        # Redraw on every page event until the job is finished
+        for event in job.events():
+            if event["event"] in ("queued", "started", "opened"):
+                continue
+            show_progress(job, progress_bar, status_text, ocr_text)
+
+        if job.status == "done":
+            # Store results in session state
+            st.session_state.result = job.result
+            st.session_state.processing_complete = True
+            st.success("Document processed successfully!")
+        else:
+            if job.status == "cancelled":
+                st.warning("Processing cancelled.")
+            else:
+                st.error(f"Error processing document: {job.error}")
+            st.session_state.job_id = None
 
 with col2:
     st.header("Results")
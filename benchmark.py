@@ -0,0 +1,264 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+from utils.llm_stub_server import LLMStubServer
+from utils.pipeline import DocumentPipeline
+from utils.tracing import Tracer, peak_rss, percentile
+
+# Metrics compared against a baseline run; True means higher is better
+TRACKED_METRICS = {
+    "throughput.pages_per_s": True,
+    "throughput.documents_per_min": True,
+    "documents.p50_s": False,
+    "documents.p95_s": False,
+    "peak_rss_bytes": False,
+    "load_s.ocr_engine": False,
+    "load_s.document_processor": False,
+}
+# Stage percentiles are tracked for every stage present in both runs
+TRACKED_STAGE_METRICS = ("p50_s", "p95_s", "p99_s")
+
+SYNTHETIC_TEXT = (
+    "ДОГОВОР ПОСТАВКИ № SM-{number}/24\n"
+    "г. Алматы «{day}» марта 2024 г.\n\n"
+    "ТОО «Покупатель», именуемое в дальнейшем «Покупатель», и ООО «Поставщик {number}», "
+    "именуемое в дальнейшем «Поставщик», заключили настоящий договор о нижеследующем.\n\n"
+    "1. ПРЕДМЕТ ДОГОВОРА\n"
+    "1.1. Поставщик обязуется поставить, а Покупатель принять и оплатить товар согласно спецификации.\n"
+    "2. ЦЕНА И ПОРЯДОК РАСЧЕТОВ\n"
+    "2.1. Общая сумма договора составляет {amount} ({currency}).\n"
+    "2.2. Валюта платежа: {currency}. Оплата производится в течение 30 банковских дней.\n"
+    "3. СРОК ДЕЙСТВИЯ\n"
+    "3.1. Договор действует до 31 декабря 2025 года.\n\n"
+    "Поставщик: ________________        Покупатель: ________________\n"
+)
+
+
+def make_synthetic_documents(output_dir, count, pages_per_document, seed):
+    """
+    Generate contract-like PDFs with PyMuPDF, half born-digital and half scanned
+
+    Scanned documents are the born-digital pages rendered to images with
+    noise added, so they have no text layer and go through OCR.
+
+    Returns:
+        List of PDF paths
+    """
+    import fitz  # PyMuPDF
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    paths = []
+    for index in range(count):
+        doc = fitz.open()
+        for page_index in range(pages_per_document):
+            page = doc.new_page(width=595, height=842)  # A4 in points
+            text = SYNTHETIC_TEXT.format(
+                number=1000 + index * 10 + page_index,
+                day=1 + int(rng.integers(0, 28)),
+                amount=f"{rng.uniform(1e4, 1e7):,.2f}".replace(",", " "),
+                currency=("KZT", "RUB", "USD")[int(rng.integers(0, 3))]
+            )
+            page.insert_htmlbox(fitz.Rect(50, 50, 545, 792), text.replace("\n", "<br>"),
+                                css="* {font-family: sans-serif; font-size: 11px;}")
+
+        if index % 2:
+            scanned = fitz.open()
+            for page in doc:
+                pix = page.get_pixmap(dpi=200, colorspace=fitz.csGRAY)
+                pixels = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.h, pix.w).astype(np.int16)
+                pixels += rng.normal(0, 12, pixels.shape).astype(np.int16)
+                noisy = fitz.Pixmap(fitz.csGRAY, pix.w, pix.h, np.clip(pixels, 0, 255).astype(np.uint8).tobytes(),
+                                    False)
+                scanned.new_page(width=page.rect.width, height=page.rect.height).insert_image(
+                    page.rect, pixmap=noisy)
+            doc.close()
+            doc = scanned
+
+        path = Path(output_dir) / f"synthetic_{index:03d}{'_scan' if index % 2 else ''}.pdf"
+        doc.save(path)
+        doc.close()
+        paths.append(str(path))
+    return paths
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(document_paths, args):
+    """Load the models, process every document args.runs times and collect metrics"""
+    tracer = Tracer()
+    load_start = time.perf_counter()
+    pipeline = DocumentPipeline(
+        llm_api_key="stub",
+        ocr_workers=args.ocr_workers,
+        layout_backend=args.layout_backend,
+        preprocess=args.preprocess,
+        tracer=tracer
+    )
+    pipeline_init = time.perf_counter() - load_start
+    warmup = pipeline.warmup()
+
+    document_times = []
+    pages = 0
+    failures = []
+    start = time.perf_counter()
+    try:
+        for _ in range(args.runs):
+            for path, result, error in pipeline.process_many(document_paths, workers=args.workers):
+                if error is not None:
+                    failures.append({"document": path, "error": repr(error)})
+                    continue
+                pages += result["pages"]
+                document_times.append(result["processing_times"]["total"])
+    finally:
+        pipeline.close()
+    wall = time.perf_counter() - start
+
+    stages = {
+        name: {key: stage[key] for key in ("count", "total_s", "p50_s", "p95_s", "p99_s", "max_s", "max_rss_bytes",
+                                         "peak_rss_delta_bytes")}
+        for name, stage in tracer.summary().items() if not name.startswith("load.")
+    }
+    return {
+        "load_s": {
+            "document_pipeline": pipeline_init + sum(warmup.values()),
+            "ocr_engine": warmup["ocr"],
+            "document_processor": warmup["vision_transformer"],
+            "llm_processor": warmup["llm"]
+        },
+        "throughput": {
+            "documents": len(document_times),
+            "pages": pages,
+            "wall_s": wall,
+            "pages_per_s": pages / wall if wall else 0.0,
+            "documents_per_min": 60 * len(document_times) / wall if wall else 0.0
+        },
+        "documents": {
+            "p50_s": percentile(document_times, 50),
+            "p95_s": percentile(document_times, 95),
+            "p99_s": percentile(document_times, 99)
+        },
+        "stages": stages,
+        "peak_rss_bytes": peak_rss(),
+        "failures": failures
+    }
+
+
+def lookup(report, dotted):
+    value = report
+    for part in dotted.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return None
+        value = value[part]
+    return value
+
+
+def find_regressions(report, baseline, threshold):
+    """
+    Compare tracked metrics with a baseline report
+
+    Args:
+        report: Report of this run
+        baseline: Report of an earlier run
+        threshold: Relative change (e.g. 0.1 for 10%) in the bad direction that counts as a regression
+
+    Returns:
+        List of dictionaries describing each regression
+    """
+    metrics = dict(TRACKED_METRICS)
+    for stage in set(report["stages"]) & set(baseline.get("stages", {})):
+        for key in TRACKED_STAGE_METRICS:
+            metrics[f"stages.{stage}.{key}"] = False
+
+    regressions = []
+    for metric, higher_is_better in sorted(metrics.items()):
+        current, previous = lookup(report, metric), lookup(baseline, metric)
+        if not current or not previous:
+            continue
+        change = (current - previous) / previous
+        if (-change if higher_is_better else change) > threshold:
+            regressions.append({"metric": metric, "baseline": previous, "current": current, "change": change})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline throughput and latency benchmark of the full pipeline.')
+    parser.add_argument('--data-dir', default='./data', help='Directory with the PDF documents to benchmark.')
+    parser.add_argument('--max-documents', type=int, default=None, help='Use at most this many PDFs from data-dir.')
+    parser.add_argument('--synthetic', type=int, default=4, help='Number of generated documents to add.')
+    parser.add_argument('--synthetic-pages', type=int, default=2, help='Pages per generated document.')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for the generated documents.')
+    parser.add_argument('--runs', type=int, default=1, help='Passes over the whole corpus.')
+    parser.add_argument('--workers', type=int, default=1, help='Documents processed concurrently.')
+    parser.add_argument('--ocr-workers', type=int, default=0)
+    parser.add_argument('--layout-backend', default='torch', choices=['torch', 'torch-int8', 'onnx'])
+    parser.add_argument('--preprocess', default='none', choices=['none', 'fast', 'quality', 'auto'])
+    parser.add_argument('--llm-latency', type=float, default=0.5, help='Seconds the stub LLM takes per request.')
+    parser.add_argument('--output', default='benchmark.json', help='JSON report of this run.')
+    parser.add_argument('--baseline', default=None, help='Earlier JSON report to check for regressions.')
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help='Relative slowdown (or throughput drop) reported as a regression.')
+    args = parser.parse_args()
+
+    document_paths = sorted(str(path) for path in Path(args.data_dir).glob('*.pdf'))[:args.max_documents]
+
+    with tempfile.TemporaryDirectory() as synthetic_dir, \
+            LLMStubServer(latency=args.llm_latency) as llm_stub:
+        document_paths += make_synthetic_documents(synthetic_dir, args.synthetic, args.synthetic_pages, args.seed)
+        # The OpenAI client picks the endpoint up from the environment
+        os.environ["OPENAI_BASE_URL"] = llm_stub.base_url
+        print(f"Benchmarking {len(document_paths)} documents x {args.runs} run(s), LLM stub at {llm_stub.base_url}")
+
+        report = run_benchmark(document_paths, args)
+
+    report["meta"] = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "config": vars(args)
+    }
+
+    throughput = report["throughput"]
+    print(f"  {throughput['pages']} pages in {throughput['wall_s']:.1f}s: "
+          f"{throughput['pages_per_s']:.2f} pages/s, {throughput['documents_per_min']:.1f} documents/min, "
+          f"peak RSS {report['peak_rss_bytes'] / 2 ** 20:.0f} MiB")
+    for name, stage in sorted(report["stages"].items()):
+        print(f"  {name:<26} n={stage['count']:<4} p50 {stage['p50_s']:.3f}s  "
+              f"p95 {stage['p95_s']:.3f}s  p99 {stage['p99_s']:.3f}s")
+
+    exit_code = 1 if report["failures"] else 0
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        report["regressions"] = find_regressions(report, baseline, args.threshold)
+        for regression in report["regressions"]:
+            print(f"  REGRESSION {regression['metric']}: {regression['baseline']:.4g} -> "
+                  f"{regression['current']:.4g} ({regression['change']:+.1%})")
+        if report["regressions"]:
+            exit_code = 1
+        else:
+            print(f"  No regressions beyond {args.threshold:.0%} against {args.baseline}")
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Report saved to: {args.output}")
+    raise SystemExit(exit_code)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+import argparse
+import json
+import statistics
+import time
+from pathlib import Path
+
+from models.document_processor import BACKENDS, DocumentProcessor
+from utils.pipeline import DocumentPipeline
+
+
+def load_pages(document_path, max_pages, cache_dir):
+    """Render and OCR the first pages of a document once, shared by every backend"""
+    pipeline = DocumentPipeline(ocr_cache_dir=cache_dir)
+    images = []
+    ocr_results = []
+    for page in pipeline._iter_pages(document_path):
+        if len(images) >= max_pages:
+            break
+        images.append(page["image"])
+        ocr_results.append(page.get("ocr_results") or pipeline.ocr_engine.recognize(page["image"].bgr()))
+    pipeline.close()
+    return images, ocr_results
+
+
+def measure(processor, images, ocr_results, runs, batch_size):
+    # First call pays for lazy initialization, keep it out of the numbers
+    analyses = processor.process_documents(images, ocr_results, batch_size=batch_size)
+
+    latencies = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        processor.process_documents(images, ocr_results, batch_size=batch_size)
+        latencies.append(time.perf_counter() - start)
+
+    return analyses, {
+        "mean_s": statistics.mean(latencies),
+        "p50_s": statistics.median(latencies),
+        "min_s": min(latencies),
+        "per_page_s": statistics.median(latencies) / len(images)
+    }
+
+
+def compare(reference, candidate):
+    """Count pages where document_type and fields agree with the reference backend"""
+    same_type = sum(1 for ref, cand in zip(reference, candidate)
+                    if ref["document_type"] == cand["document_type"])
+    same_fields = sum(1 for ref, cand in zip(reference, candidate)
+                      if ref["fields"] == cand["fields"])
+    max_confidence_diff = max(abs(ref["confidence"] - cand["confidence"])
+                              for ref, cand in zip(reference, candidate))
+    return {
+        "document_type_match": same_type / len(reference),
+        "fields_match": same_fields / len(reference),
+        "max_confidence_diff": max_confidence_diff,
+        "parity": same_type == len(reference) and same_fields == len(reference)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare LayoutLMv3 inference backends for parity and latency.')
+    parser.add_argument('--document', default='./data/199.pdf', help='PDF or image used as input.')
+    parser.add_argument('--model', default='microsoft/layoutlmv3-base', help='LayoutLMv3 checkpoint name or path.')
+    parser.add_argument('--backends', nargs='+', default=list(BACKENDS), choices=BACKENDS)
+    parser.add_argument('--pages', type=int, default=4, help='Maximum number of pages to use.')
+    parser.add_argument('--runs', type=int, default=5, help='Timed runs per backend.')
+    parser.add_argument('--batch_size', type=int, default=8)
+    parser.add_argument('--cache_dir', default='./cache/ocr', help='OCR cache so reruns skip PaddleOCR.')
+    parser.add_argument('--output', default=None, help='Optional JSON file for the report.')
+    args = parser.parse_args()
+
+    images, ocr_results = load_pages(args.document, args.pages, args.cache_dir)
+    print(f"Comparing {', '.join(args.backends)} on {len(images)} page(s) of {Path(args.document).name}")
+
+    report = {"document": args.document, "pages": len(images), "backends": {}}
+    reference = None
+    for backend in args.backends:
+        load_start = time.perf_counter()
+        processor = DocumentProcessor(args.model, backend=backend, device="cpu")
+        load_time = time.perf_counter() - load_start
+
+        analyses, latency = measure(processor, images, ocr_results, args.runs, args.batch_size)
+        entry = {"load_s": load_time, "latency": latency}
+
+        if reference is None:
+            reference = analyses
+            entry["reference"] = True
+        else:
+            entry["parity"] = compare(reference, analyses)
+
+        report["backends"][backend] = entry
+        parity = entry.get("parity")
+        print(f"  {backend:<11} load {load_time:6.2f}s  p50 {latency['p50_s']:.3f}s "
+              f"({latency['per_page_s']:.3f}s/page)"
+              + (f"  type match {parity['document_type_match']:.0%}, fields match {parity['fields_match']:.0%}"
+                 if parity else "  (reference)"))
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"Report saved to: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,6 +7,10 @@ case "$1" in
   web)
     exec streamlit run app/streamlit_app.py --server.port "${STREAMLIT_SERVER_PORT:-8501}" --server.address "${STREAMLIT_SERVER_ADDRESS:-0.0.0.0}"
     ;;
+  api)
+    shift
+    exec python app/api_server.py --port "${API_PORT:-8000}" "$@"
+    ;;
   cli)
     shift
     exec python run.py "$@"
@@ -1,11 +1,15 @@
 import argparse
 import json
 import os
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 from dotenv import load_dotenv
 from openai import OpenAI
 
+from utils.evaluator import OCREvaluator
+from utils.pipeline import DocumentPipeline
+
 load_dotenv()
 
 
@@ -73,19 +77,79 @@ Generated JSON:
         return {"matched_fields_count": 0, "is_perfect_match": False}
 
 
+def load_json(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def judge_document(pdf_path, ref_json_path, generated_json_output_path, generated_data, client):
+    """
+    Compare one generated JSON with its reference; runs on the judge thread pool
+
+    Fields are compared by the deterministic matcher first. Only the fields it
+    cannot decide go to the LLM judge, or count as mismatches without a client.
+    """
+    try:
+        reference_data = load_json(ref_json_path)
+    except (json.JSONDecodeError, FileNotFoundError) as e:
+        print(f"Error reading reference JSON {ref_json_path.name}: {e}. Skipping evaluation.")
+        return None
+
+    extracted = generated_data.get("extracted_data", generated_data)
+    local_result = OCREvaluator().match_fields(reference_data, extracted)
+    undecided = local_result["undecided"]
+
+    matched_fields_count = local_result["matched_fields_count"]
+    is_perfect_match = local_result["is_perfect_match"]
+    judged_by_llm = []
+    if undecided and client is not None:
+        eval_result = evaluate_with_llm(
+            json.dumps({field: reference_data[field] for field in undecided}, ensure_ascii=False, indent=2),
+            json.dumps({field: extracted.get(field) for field in undecided}, ensure_ascii=False, indent=2),
+            client
+        )
+        matched_fields_count += eval_result.get("matched_fields_count", 0)
+        judged_by_llm = undecided
+        if is_perfect_match is None:
+            is_perfect_match = bool(eval_result.get("is_perfect_match", False))
+    elif is_perfect_match is None:
+        is_perfect_match = False
+
+    print(f"  {pdf_path.name}: matched fields: {matched_fields_count}/{len(reference_data)}, "
+          f"perfect match: {is_perfect_match}"
+          + (f" (LLM judged {', '.join(judged_by_llm)})" if judged_by_llm else ""))
+
+    return {
+        "pdf_file": pdf_path.name,
+        "reference_json": ref_json_path.name,
+        "generated_json": generated_json_output_path.name,
+        "matched_fields_count": matched_fields_count,
+        "is_perfect_match": is_perfect_match,
+        "field_matches": {field: result["match"] for field, result in local_result["fields"].items()},
+        "llm_judged_fields": judged_by_llm
+    }
+
+
 def main():
     parser = argparse.ArgumentParser(description='Evaluate document processing pipeline.')
     parser.add_argument('--data_folder', default='./data',
                         help='Path to the data folder containing PDFs and reference JSONs.')
     parser.add_argument('--output_dir', default='./evaluation_output',
                         help='Directory to save generated JSONs and evaluation results.')
-    parser.add_argument('--run_script', default='./run.py', help='Path to the run.py script.')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Number of documents processed concurrently by the pipeline.')
+    parser.add_argument('--judge_workers', type=int, default=4,
+                        help='Maximum number of judge requests in flight.')
+    parser.add_argument('--no_llm_judge', action='store_true',
+                        help='Judge offline: fields the local matcher cannot decide count as mismatches.')
+    parser.add_argument('--resume', action='store_true',
+                        help='Reuse generated JSONs already in the output directory instead of re-running the '
+                             'pipeline; only safe when they come from the same pipeline version and settings.')
 
     args = parser.parse_args()
 
     data_folder = Path(args.data_folder).resolve()
     output_dir = Path(args.output_dir).resolve()
-    run_script = Path(args.run_script).resolve()
 
     output_dir.mkdir(parents=True, exist_ok=True)
 
@@ -93,72 +157,68 @@ def main():
         print("Error: OPENAI_API_KEY environment variable not set. Please set it before running the script.")
         return
 
-    client = OpenAI()  # Initialize OpenAI client
+    # The LLM judge only sees fields the local matcher cannot decide
+    client = None if args.no_llm_judge else OpenAI()
+
+    # Load the models once and keep them warm for every document
+    pipeline = DocumentPipeline(llm_api_key=os.environ.get("OPENAI_API_KEY"))
 
     file_map = map_files(data_folder)
 
     total_documents = len(file_map)
-    perfect_matches_count = 0
-    all_eval_results = []
-
     print(f"Starting evaluation for {total_documents} documents...")
 
-    for pdf_path_str, ref_json_path_str in file_map.items():
-        pdf_path = Path(pdf_path_str)
-        ref_json_path = Path(ref_json_path_str)
-
-        print(f"Processing {pdf_path.name}...")
-
-        # Define output path for the generated JSON
-        generated_json_output_path = output_dir / f"generated_{pdf_path.stem}.json"
-
-        # Run the run.py script
-        print(f"Running {run_script.name} for {pdf_path.name}...")
-        command = f"python3 {run_script} --image {pdf_path} --output {generated_json_output_path}"
-
-        # Execute the command
-        # Note: This assumes run.py handles its own output/errors.
-        # For a robust solution, you might want to capture stdout/stderr.
-        os.system(command)
-
-        if not generated_json_output_path.exists():
-            print(
-                f"Error: {generated_json_output_path.name} was not generated by run.py. Skipping evaluation for this document.")
-            continue
-
-        # Read reference and generated JSONs
+    def output_path(pdf_path_str):
+        return output_dir / f"generated_{Path(pdf_path_str).stem}.json"
+
+    # Judging runs next to extraction: document N is judged while N+1 goes through the pipeline
+    judge_futures = {}
+    with ThreadPoolExecutor(max_workers=args.judge_workers, thread_name_prefix="judge") as judges:
+        def submit_judge(pdf_path_str, generated_data):
+            judge_futures[pdf_path_str] = judges.submit(
+                judge_document, Path(pdf_path_str), Path(file_map[pdf_path_str]),
+                output_path(pdf_path_str), generated_data, client
+            )
+
+        to_extract = []
+        for pdf_path_str in file_map:
+            generated_path = output_path(pdf_path_str)
+            if not args.resume or not generated_path.exists():
+                to_extract.append(pdf_path_str)
+                continue
+            try:
+                generated_data = load_json(generated_path)
+            except json.JSONDecodeError:
+                # A run interrupted while writing leaves a broken file, extract again
+                to_extract.append(pdf_path_str)
+                continue
+            print(f"Reusing {generated_path.name}")
+            submit_judge(pdf_path_str, generated_data)
+
+        print(f"Extracting {len(to_extract)} documents, {total_documents - len(to_extract)} already generated")
         try:
-            with open(ref_json_path, 'r', encoding='utf-8') as f:
-                reference_data = json.load(f)
-            with open(generated_json_output_path, 'r', encoding='utf-8') as f:
-                generated_data = json.load(f)
-        except json.JSONDecodeError as e:
-            print(f"Error decoding JSON for {pdf_path.name}: {e}. Skipping evaluation.")
-            continue
-        except FileNotFoundError:
-            print(
-                f"Error: Reference JSON {ref_json_path.name} or generated JSON {generated_json_output_path.name} not found. Skipping evaluation.")
-            continue
-
-        # Perform LLM evaluation
-        print(f"Evaluating output for {pdf_path.name} with LLM...")
-        eval_result = evaluate_with_llm(json.dumps(reference_data, ensure_ascii=False, indent=2),
-                                        json.dumps(generated_data, ensure_ascii=False, indent=2),
-                                        client)
-
-        all_eval_results.append({
-            "pdf_file": pdf_path.name,
-            "reference_json": ref_json_path.name,
-            "generated_json": generated_json_output_path.name,
-            "matched_fields_count": eval_result.get("matched_fields_count", 0),
-            "is_perfect_match": eval_result.get("is_perfect_match", False)
-        })
-
-        if eval_result.get("is_perfect_match"):
-            perfect_matches_count += 1
-
-        print(
-            f"  Matched fields: {eval_result.get('matched_fields_count', 0)}, Perfect match: {eval_result.get('is_perfect_match', False)}")
+            for pdf_path_str, result, error in pipeline.process_many(to_extract, workers=args.workers):
+                pdf_name = Path(pdf_path_str).name
+                if error is not None:
+                    print(f"Error: pipeline failed for {pdf_name}: {error}. Skipping evaluation for this document.")
+                    continue
+
+                print(f"Extracted {pdf_name}, queued for evaluation")
+                # Write to a temporary name first, so an interrupted run never leaves a half-written file
+                generated_path = output_path(pdf_path_str)
+                tmp_path = generated_path.with_suffix('.json.tmp')
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(result, f, ensure_ascii=False, indent=2)
+                os.replace(tmp_path, generated_path)
+                submit_judge(pdf_path_str, result)
+        finally:
+            pipeline.close()
+
+    # Keep the summary in file order, whatever order the judges finished in
+    all_eval_results = [judge_futures[pdf_path_str].result() for pdf_path_str in file_map
+                        if pdf_path_str in judge_futures]
+    all_eval_results = [eval_result for eval_result in all_eval_results if eval_result is not None]
+    perfect_matches_count = sum(1 for eval_result in all_eval_results if eval_result["is_perfect_match"])
 
     # Save all evaluation results to a summary file
     summary_file_path = output_dir / "evaluation_summary.json"
@@ -168,7 +228,8 @@ def main():
     print("--- Evaluation Summary ---")
     print(f"Total documents processed: {total_documents}")
     print(
-        f"Documents with perfect matches: {perfect_matches_count}/{total_documents} ({perfect_matches_count / total_documents:.2%})")
+        f"Documents with perfect matches: {perfect_matches_count}/{total_documents} "
+        f"({perfect_matches_count / max(total_documents, 1):.2%})")
     print(f"Detailed results saved to: {summary_file_path}")
 
 
@@ -1,38 +1,288 @@
+import logging
+import os
+import re
+
 from transformers import (
     LayoutLMv3Processor,
-    LayoutLMv3ForSequenceClassification,
-    LayoutLMv3ForTokenClassification
+    LayoutLMv3Model
 )
+from transformers.models.layoutlmv3.modeling_layoutlmv3 import LayoutLMv3ClassificationHead
 import torch
+from torch import nn
 from PIL import Image
 import numpy as np
 
+from utils.tracing import NULL_TRACER
+
+BACKENDS = ("torch", "torch-int8", "onnx")
+HEADS = ("doc_head", "token_head")
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_boxes(polys, width, height):
+    """
+    Convert OCR polygons to LayoutLMv3 boxes in one vectorized pass
+
+    Args:
+        polys: Array of shape (N, K, 2) with polygon points in pixels
+        width: Page width in pixels
+        height: Page height in pixels
+
+    Returns:
+        int64 array of shape (N, 4) with (x1, y1, x2, y2) scaled to 0-1000
+    """
+    polys = np.asarray(polys, dtype=np.float32)
+    if polys.size == 0:
+        return np.zeros((0, 4), dtype=np.int64)
+    polys = polys.reshape(len(polys), -1, 2)
+
+    scale = np.array([1000.0 / width, 1000.0 / height], dtype=np.float32)
+    boxes = np.concatenate([polys.min(axis=1) * scale, polys.max(axis=1) * scale], axis=1)
+    np.clip(boxes, 0, 1000, out=boxes)
+    return boxes.astype(np.int64)
+
+
+def quantizable_linears(model):
+    """
+    Names of the Linear layers dynamic INT8 quantization may replace
+
+    The relative position bias layers (encoder.rel_pos_*) are left out: the
+    encoder reads their .weight as a tensor, which quantized Linear layers
+    turn into a method.
+    """
+    return {name for name, module in model.named_modules()
+            if isinstance(module, nn.Linear) and ".rel_pos" not in name}
+
+
+def load_head_state(model_name, config):
+    """
+    Read trained head weights from a checkpoint, if it has any
+
+    Checkpoints saved from LayoutLMv3MultiHead keep them under 'doc_head.' and
+    'token_head.'. Fine-tuned LayoutLMv3ForSequenceClassification and
+    LayoutLMv3ForTokenClassification checkpoints keep their one head under
+    'classifier.'; config.architectures tells which head that is.
+
+    Args:
+        model_name: HuggingFace model name or local checkpoint directory
+        config: Config of the checkpoint
+
+    Returns:
+        Dictionary of head name ('doc_head', 'token_head') to its state dict,
+        without the heads the checkpoint does not contain
+    """
+    from transformers.utils import SAFE_WEIGHTS_NAME, WEIGHTS_NAME, cached_file
+
+    state = {}
+    for filename in (SAFE_WEIGHTS_NAME, WEIGHTS_NAME):
+        path = cached_file(model_name, filename, _raise_exceptions_for_missing_entries=False)
+        if path is None:
+            continue
+        if filename == SAFE_WEIGHTS_NAME:
+            from safetensors.torch import load_file
+            state = load_file(path)
+        else:
+            state = torch.load(path, map_location="cpu", weights_only=True)
+        break
+
+    def strip(prefix):
+        return {key[len(prefix):]: value for key, value in state.items() if key.startswith(prefix)}
+
+    heads = {name: strip(name + ".") for name in HEADS}
+    heads = {name: head for name, head in heads.items() if head}
+    classifier = strip("classifier.")
+    if classifier:
+        architectures = config.architectures or []
+        # A bare Linear classifier only exists in token classification models
+        token_model = (any("TokenClassification" in name for name in architectures)
+                       or "dense.weight" not in classifier)
+        heads.setdefault("token_head" if token_model else "doc_head", classifier)
+    return heads
+
+
+class LayoutLMv3MultiHead(nn.Module):
+    def __init__(self, encoder, head_seed=0, head_state=None):
+        """
+        One LayoutLMv3 encoder shared by the document and token classification heads
+
+        Args:
+            encoder: Pretrained LayoutLMv3Model backbone
+            head_seed: Seed for heads the checkpoint has no weights for, so every
+                backend and every process gets the same head weights
+            head_state: Trained head weights from load_head_state()
+        """
+        super().__init__()
+        config = encoder.config
+        self.encoder = encoder
+
+        # Same head layout as LayoutLMv3ForSequenceClassification
+        self.doc_head = LayoutLMv3ClassificationHead(config, pool_feature=False)
+
+        # Same head layout as LayoutLMv3ForTokenClassification
+        self.dropout = nn.Dropout(config.hidden_dropout_prob)
+        if config.num_labels < 10:
+            self.token_head = nn.Linear(config.hidden_size, config.num_labels)
+        else:
+            self.token_head = LayoutLMv3ClassificationHead(config, pool_feature=False)
+
+        with torch.random.fork_rng(devices=[]):
+            torch.manual_seed(head_seed)
+            self.doc_head.apply(encoder._init_weights)
+            self.token_head.apply(encoder._init_weights)
+
+        untrained = []
+        for name in HEADS:
+            state = (head_state or {}).get(name)
+            if state is None:
+                untrained.append(name)
+                continue
+            try:
+                getattr(self, name).load_state_dict(state)
+            except RuntimeError as e:
+                logger.warning("Checkpoint weights of %s do not fit the head: %s", name, e)
+                untrained.append(name)
+        if untrained:
+            logger.warning("No trained weights for %s in the checkpoint, initialized from head_seed=%d; "
+                           "their predictions are not meaningful", ", ".join(untrained), head_seed)
+
+    def forward(self, input_ids, attention_mask=None, bbox=None, pixel_values=None, **kwargs):
+        """Run the encoder once and return (document logits, token logits)"""
+        sequence_output = self.encoder(
+            input_ids=input_ids,
+            attention_mask=attention_mask,
+            bbox=bbox,
+            pixel_values=pixel_values,
+            **kwargs
+        )[0]
+
+        doc_logits = self.doc_head(sequence_output[:, 0, :])
+
+        # Visual patch tokens follow the text tokens, keep only the text part
+        text_output = self.dropout(sequence_output[:, :input_ids.size(1)])
+        token_logits = self.token_head(text_output)
+
+        return doc_logits, token_logits
+
 
 class DocumentProcessor:
-    def __init__(self, model_name="microsoft/layoutlmv3-base", device=None):
+    def __init__(self, model_name="microsoft/layoutlmv3-base", device=None, backend="torch", onnx_path=None,
+                 max_length=512, sliding_window=True, stride=128, tracer=None):
         """
         Initialize LayoutLMv3 for document understanding
 
         Args:
             model_name: HuggingFace model name
             device: Device to run on ('cuda' or 'cpu')
+            backend: Inference backend: 'torch' (eager PyTorch), 'torch-int8'
+                (dynamically quantized PyTorch, CPU only) or 'onnx' (ONNX Runtime)
+            onnx_path: Where the exported ONNX model is stored and reused,
+                defaults to a file under the HuggingFace cache
+            max_length: Maximum number of tokens per forward pass sequence
+            sliding_window: Split pages longer than max_length into overlapping
+                windows instead of truncating them
+            stride: Number of tokens shared by consecutive windows
+            tracer: Optional utils.tracing.Tracer receiving spans for input
+                preparation, encoding, the forward pass and decoding
         """
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown backend '{backend}', expected one of {BACKENDS}")
+        self.backend = backend
+        self.max_length = max_length
+        self.sliding_window = sliding_window
+        self.stride = stride
+        self.tracer = tracer if tracer is not None else NULL_TRACER
+
         if device is None:
             self.device = "cuda" if torch.cuda.is_available() else "cpu"
         else:
             self.device = device
+        if backend == "torch-int8":
+            # Dynamic quantization kernels only exist for CPU
+            self.device = "cpu"
 
-        # Initialize processor and model for document classification
+        # Initialize processor and a single backbone shared by both heads
+        # (document classification and token classification for field extraction)
         self.processor = LayoutLMv3Processor.from_pretrained(model_name, apply_ocr=False)
-        self.doc_classifier = LayoutLMv3ForSequenceClassification.from_pretrained(
-            model_name
+        encoder = LayoutLMv3Model.from_pretrained(model_name)
+        self.model = LayoutLMv3MultiHead(
+            encoder, head_state=load_head_state(model_name, encoder.config)
         ).to(self.device)
+        self.model.eval()
+
+        self.session = None
+        if backend == "torch-int8":
+            self.model = torch.ao.quantization.quantize_dynamic(
+                self.model, quantizable_linears(self.model), dtype=torch.qint8
+            )
+        elif backend == "onnx":
+            self.session = self._load_onnx_session(onnx_path or self._default_onnx_path(model_name))
+            # The session holds its own copy of the weights
+            self.model = None
+
+    def _default_onnx_path(self, model_name):
+        cache_dir = os.environ.get("HF_HOME", os.path.join(os.path.expanduser("~"), ".cache", "huggingface"))
+        slug = re.sub(r"[^A-Za-z0-9_.-]+", "--", model_name)
+        return os.path.join(cache_dir, "onnx", f"{slug}-multihead-v3.onnx")
+
+    def _load_onnx_session(self, onnx_path):
+        """Export the shared-encoder model to ONNX once, then open it with ONNX Runtime"""
+        try:
+            import onnxruntime
+        except ImportError as e:
+            raise ImportError("The 'onnx' backend needs onnxruntime: pip install onnx onnxruntime") from e
+
+        if not os.path.exists(onnx_path):
+            self._export_onnx(onnx_path)
 
-        # Initialize model for token classification (field extraction)
-        self.token_classifier = LayoutLMv3ForTokenClassification.from_pretrained(
-            model_name
+        providers = ["CPUExecutionProvider"]
+        if self.device == "cuda" and "CUDAExecutionProvider" in onnxruntime.get_available_providers():
+            providers.insert(0, "CUDAExecutionProvider")
+        return onnxruntime.InferenceSession(onnx_path, providers=providers)
+
+    def _export_onnx(self, onnx_path):
+        os.makedirs(os.path.dirname(onnx_path), exist_ok=True)
+
+        # Two pages: the exporter fixes any axis that has size 1 in the example, outputs included
+        dummy = self.processor(
+            [Image.new("RGB", (224, 224), "white")] * 2,
+            [["export"], ["batch", "export"]],
+            boxes=[[[0, 0, 10, 10]], [[0, 0, 10, 10], [20, 0, 30, 10]]],
+            padding=True,
+            return_tensors="pt"
         ).to(self.device)
 
+        input_names = ["input_ids", "attention_mask", "bbox", "pixel_values"]
+        torch.onnx.export(
+            self.model,
+            tuple(dummy[name] for name in input_names),
+            onnx_path,
+            input_names=input_names,
+            output_names=["doc_logits", "token_logits"],
+            dynamic_axes={
+                "input_ids": {0: "batch", 1: "sequence"},
+                "attention_mask": {0: "batch", 1: "sequence"},
+                "bbox": {0: "batch", 1: "sequence"},
+                "pixel_values": {0: "batch"},
+                "doc_logits": {0: "batch"},
+                "token_logits": {0: "batch", 1: "sequence"}
+            },
+            opset_version=17
+        )
+
+    def _forward(self, encoding):
+        """Run the selected backend and return (document logits, token logits) as tensors"""
+        if self.session is not None:
+            feed = {
+                node.name: encoding[node.name].cpu().numpy()
+                for node in self.session.get_inputs()
+            }
+            doc_logits, token_logits = self.session.run(["doc_logits", "token_logits"], feed)
+            return torch.from_numpy(doc_logits), torch.from_numpy(token_logits)
+
+        with torch.no_grad():
+            return self.model(**encoding)
+
     def process_document(self, image, ocr_results):
         """
         Process document with LayoutLMv3 to understand structure
@@ -44,49 +294,166 @@ class DocumentProcessor:
         Returns:
             Document structure analysis
         """
-        if isinstance(image, str):
-            image = Image.open(image).convert("RGB")
-
-        # Extract words and bounding boxes from OCR results
-        words = [item['text'] for item in ocr_results['results']]
-        boxes = [item['box'] for item in ocr_results['results']]
-
-        # Normalize boxes to required format (x1, y1, x2, y2)
-        normalized_boxes = []
-        for box in boxes:
-            x_coords = [coord[0] for coord in box]
-            y_coords = [coord[1] for coord in box]
-            normalized_boxes.append([
-                min(x_coords), min(y_coords), max(x_coords), max(y_coords)
-            ])
-
-        # Create model inputs
-        encoding = self.processor(
-            image,
-            words,
-            boxes=normalized_boxes,
-            truncation=True,
-            padding="max_length",
-            return_tensors="pt"
-        ).to(self.device)
+        return self.process_documents([image], [ocr_results])[0]
 
-        # Get document structure predictions
-        with torch.no_grad():
-            outputs = self.doc_classifier(**encoding)
+    def process_documents(self, images, ocr_results_list, batch_size=8):
+        """
+        Process several pages with LayoutLMv3 in batched forward passes
 
-        # Process token classification for field extraction
-        with torch.no_grad():
-            token_outputs = self.token_classifier(**encoding)
-            token_predictions = token_outputs.logits.argmax(-1).squeeze().tolist()
+        Pages are grouped into buckets of similar length before batching, and
+        every batch is padded only to its longest sequence, so sparse pages
+        cost less compute than dense ones.
 
-        # Map token predictions to original words
-        field_mappings = self._map_tokens_to_fields(words, token_predictions)
+        Args:
+            images: List of PIL Images, PageImages or paths to images
+            ocr_results_list: OCR results from PaddleOCR, one per image
+            batch_size: Number of pages encoded and run per forward pass
 
-        return {
-            'document_type': outputs.logits.argmax(-1).item(),
-            'confidence': torch.softmax(outputs.logits, dim=-1).max().item(),
-            'fields': field_mappings
-        }
+        Returns:
+            List of document structure analyses in input order
+        """
+        if len(images) != len(ocr_results_list):
+            raise ValueError("images and ocr_results_list must have the same length")
+
+        # Length buckets: neighbours in this order have similar token counts
+        order = sorted(range(len(images)), key=lambda i: self._estimate_length(ocr_results_list[i]))
+
+        analyses = [None] * len(images)
+        for start in range(0, len(order), batch_size):
+            indices = order[start:start + batch_size]
+            batch_analyses = self._process_batch(
+                [images[i] for i in indices],
+                [ocr_results_list[i] for i in indices]
+            )
+            for index, analysis in zip(indices, batch_analyses):
+                analyses[index] = analysis
+        return analyses
+
+    def _estimate_length(self, ocr_results):
+        """Cheap proxy for the token count of a page, used to sort pages into buckets"""
+        return sum(len(item['text']) + 1 for item in ocr_results['results'])
+
+    def _process_batch(self, images, ocr_results_list):
+        """Run one batched forward pass over a chunk of pages"""
+        with self.tracer.span("layout.prepare", batch=len(images)):
+            batch_images, batch_words, batch_boxes = self._prepare_inputs(images, ocr_results_list)
+
+        # Create model inputs for the whole chunk in one processor call, padded
+        # to the longest sequence. Dense pages are split into overlapping windows
+        # instead of being truncated at max_length.
+        with self.tracer.span("layout.encode", batch=len(images)) as span:
+            encoding = self.processor(
+                batch_images,
+                batch_words,
+                boxes=batch_boxes,
+                truncation=True,
+                padding="longest",
+                max_length=self.max_length,
+                stride=self.stride if self.sliding_window else 0,
+                return_overflowing_tokens=self.sliding_window,
+                return_tensors="pt"
+            )
+            if self.sliding_window:
+                window_pages = encoding.pop("overflow_to_sample_mapping").tolist()
+                if isinstance(encoding["pixel_values"], list):
+                    # With overflowing tokens the processor hands out one image tensor
+                    # per window (already repeated per page through the mapping)
+                    encoding["pixel_values"] = torch.stack(encoding["pixel_values"])
+            else:
+                window_pages = list(range(len(batch_words)))
+            encoding = encoding.to(self.device)
+            span.set(windows=len(window_pages), sequence_length=encoding["input_ids"].size(1))
+
+        # Get document structure and token predictions from one encoder pass
+        with self.tracer.span("layout.forward", backend=self.backend, windows=len(window_pages)):
+            doc_logits, token_logits = self._forward(encoding)
+            if self.tracer.enabled and str(self.device).startswith("cuda"):
+                # CUDA kernels run asynchronously, wait so the span covers them
+                torch.cuda.synchronize()
+
+        with self.tracer.span("layout.decode", batch=len(images)):
+            return self._decode(encoding, window_pages, batch_words, doc_logits, token_logits)
+
+    def _prepare_inputs(self, images, ocr_results_list):
+        """Collect model images, words and 0-1000 boxes for a chunk of pages"""
+        batch_images = []
+        batch_words = []
+        batch_boxes = []
+        for image, ocr_results in zip(images, ocr_results_list):
+            if isinstance(image, str):
+                image = Image.open(image).convert("RGB")
+
+            # Extract words and bounding boxes from OCR results
+            words = [item['text'] for item in ocr_results['results']]
+            width, height = image.size
+            if hasattr(image, "layout_image"):
+                # utils.page_image.PageImage: boxes use the full page size,
+                # the model only needs the downscaled image
+                image = image.layout_image()
+            normalized_boxes = normalize_boxes(ocr_results['boxes'], width, height).tolist()
+
+            batch_images.append(image)
+            batch_words.append(words)
+            batch_boxes.append(normalized_boxes)
+        return batch_images, batch_words, batch_boxes
+
+    def _decode(self, encoding, window_pages, batch_words, doc_logits, token_logits):
+        """Turn the logits of all windows into one analysis per page"""
+        token_predictions = token_logits.argmax(-1).tolist()
+
+        analyses = []
+        for page_index, words in enumerate(batch_words):
+            windows = [i for i, page in enumerate(window_pages) if page == page_index]
+
+            # Average the document logits of all windows of the page
+            probabilities = torch.softmax(doc_logits[windows].mean(dim=0), dim=-1)
+
+            word_predictions = self._merge_windows(
+                len(words),
+                [encoding.word_ids(i) for i in windows],
+                [token_predictions[i] for i in windows]
+            )
+
+            # Map word predictions to document fields
+            field_mappings = self._map_tokens_to_fields(words, word_predictions)
+
+            analyses.append({
+                'document_type': probabilities.argmax(-1).item(),
+                'confidence': probabilities.max().item(),
+                'fields': field_mappings
+            })
+
+        return analyses
+
+    def _merge_windows(self, word_count, windows_word_ids, windows_predictions):
+        """
+        Collapse token predictions of one or more windows into one label per word
+
+        Each word takes the prediction of its first sub-token. A word seen by
+        two overlapping windows keeps the prediction from the window where it
+        sits furthest from the window edge, i.e. where it had the most context.
+        """
+        predictions = [0] * word_count
+        best_margin = [-1] * word_count
+
+        for word_ids, token_predictions in zip(windows_word_ids, windows_predictions):
+            positions = [pos for pos, word_id in enumerate(word_ids) if word_id is not None]
+            if not positions:
+                continue
+            first, last = positions[0], positions[-1]
+
+            previous = None
+            for pos, word_id in enumerate(word_ids):
+                if word_id is None or word_id == previous:
+                    previous = word_id
+                    continue
+                previous = word_id
+                margin = min(pos - first, last - pos)
+                if margin > best_margin[word_id]:
+                    best_margin[word_id] = margin
+                    predictions[word_id] = token_predictions[pos]
+
+        return predictions
 
     def _map_tokens_to_fields(self, words, token_predictions):
         """Map token predictions to document fields"""
@@ -1,25 +1,50 @@
+import asyncio
+import hashlib
 import json
 import os
+import random
 
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import (
+    APIConnectionError,
+    APITimeoutError,
+    AsyncOpenAI,
+    InternalServerError,
+    OpenAI,
+    RateLimitError
+)
+
+from utils.tracing import NULL_TRACER
+
+# Transient failures worth retrying; APITimeoutError is a subclass of APIConnectionError
+_RETRYABLE_ERRORS = (RateLimitError, APIConnectionError, APITimeoutError, InternalServerError)
 
 
 class LLMProcessor:
-    def __init__(self, api_key=None, model="gpt-4o"):
+    def __init__(self, api_key=None, model="gpt-4o", cache=None, base_url=None, tracer=None):
         """
         Initialize LLM processor for OCR post-processing
 
         Args:
             api_key: OpenAI API key
             model: Model to use
+            cache: Optional cache with get/set (e.g. utils.cache.DiskCache) for
+                parsed responses, keyed by model and prompts
+            base_url: Optional OpenAI-compatible endpoint, e.g. a local server
+            tracer: Optional utils.tracing.Tracer receiving spans for prompt
+                building, the API call (with token counts) and JSON parsing
         """
         if api_key is None:
             load_dotenv()
             api_key = os.environ.get("OPENAI_API_KEY")
 
-        self.client = OpenAI(api_key=api_key)
+        self.client = self._create_client(api_key, base_url)
         self.model = model
+        self.cache = cache
+        self.tracer = tracer if tracer is not None else NULL_TRACER
+
+    def _create_client(self, api_key, base_url):
+        return OpenAI(api_key=api_key, base_url=base_url)
 
     def process_document(self, ocr_text, document_type, fields=None):
         """
@@ -33,6 +58,32 @@ class LLMProcessor:
         Returns:
             Structured JSON with extracted information
         """
+        with self.tracer.span("llm.prompt_build"):
+            messages = self._build_messages(ocr_text, document_type, fields)
+
+        key, cached = self._cache_lookup(messages)
+        if cached is not None:
+            return cached
+
+        with self.tracer.span("llm.call", model=self.model) as span:
+            response = self.client.chat.completions.create(
+                model=self.model,
+                response_format={"type": "json_object"},  # noqa
+                messages=messages,  # noqa
+                temperature=0
+            )
+            self._record_usage(span, response)
+
+        with self.tracer.span("llm.parse"):
+            return self._parse_response(response, key)
+
+    def _record_usage(self, span, response):
+        """Tag an llm.call span with the token counts reported by the API"""
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            span.set(prompt_tokens=usage.prompt_tokens, completion_tokens=usage.completion_tokens)
+
+    def _build_messages(self, ocr_text, document_type, fields=None):
         # Create prompt based on document type
         # if document_type == 0:  # Receipt
         #     prompt = self._create_receipt_prompt(ocr_text, fields)
@@ -41,21 +92,28 @@ class LLMProcessor:
         # elif document_type == 2:  # Statement
         #     prompt = self._create_statement_prompt(ocr_text, fields)
         # else:
-        response = self.client.chat.completions.create(
-            model=self.model,
-            response_format={"type": "json_object"},  # noqa
-            messages=[  # noqa
-                {"role": "system",
-                 "content": self._system_prompt()},
-                {"role": "user", "content": self._message_prompt(ocr_text, fields)}
-            ],
-            temperature=0
-        )
-
-        # Extract JSON from response
+        return [
+            {"role": "system",
+             "content": self._system_prompt()},
+            {"role": "user", "content": self._message_prompt(ocr_text, fields)}
+        ]
+
+    def _cache_lookup(self, messages):
+        """Return (cache key, cached result), both None when caching is disabled"""
+        # temperature=0 makes identical prompts safe to answer from the cache
+        if self.cache is None:
+            return None, None
+        key = self.cache_key(messages)
+        cached = self.cache.get(key)
+        if cached is not None:
+            cached["cache_hit"] = True
+        return key, cached
+
+    def _parse_response(self, response, key=None):
+        """Extract JSON from a chat completion and cache it on success"""
         try:
             extracted_data = json.loads(response.choices[0].message.content)
-            return {
+            result = {
                 "success": True,
                 "data": extracted_data
             }
@@ -66,6 +124,29 @@ class LLMProcessor:
                 "raw_response": response.choices[0].message.content
             }
 
+        # Only successfully parsed responses are cached
+        if key is not None:
+            self.cache.set(key, result)
+            result["cache_hit"] = False
+        return result
+
+    def cache_key(self, messages):
+        """
+        Cache key of a chat request: model plus system and user prompts
+
+        Args:
+            messages: Chat messages sent to the model
+
+        Returns:
+            Hex digest identifying the request
+        """
+        payload = json.dumps({"model": self.model, "messages": messages}, ensure_ascii=False, sort_keys=True)
+        return hashlib.blake2b(payload.encode('utf-8'), digest_size=20).hexdigest()
+
+    def cache_stats(self):
+        """Return cache hit/miss counters and size, or None without a cache"""
+        return self.cache.stats() if self.cache is not None else None
+
     def _message_prompt(self, ocr_text, fields=None):
         return f"""
         Extract key information from this document.
@@ -121,6 +202,121 @@ class LLMProcessor:
         """
 
 
+class AsyncLLMProcessor(LLMProcessor):
+    def __init__(self, api_key=None, model="gpt-4o", cache=None, base_url=None,
+                 max_concurrency=8, max_retries=5, backoff_base=1.0, backoff_max=60.0, tracer=None):
+        """
+        asyncio variant of LLMProcessor for many documents in flight at once
+
+        Args:
+            api_key: OpenAI API key
+            model: Model to use
+            cache: Optional cache with get/set for parsed responses
+            base_url: Optional OpenAI-compatible endpoint, e.g. a local fake server
+            tracer: Optional utils.tracing.Tracer receiving prompt, call and parse spans
+            max_concurrency: Maximum number of requests in flight
+            max_retries: Retries for rate limits, timeouts, connection and 5xx errors
+            backoff_base: First retry delay in seconds, doubled on every attempt
+            backoff_max: Upper bound for a single retry delay in seconds
+        """
+        super().__init__(api_key=api_key, model=model, cache=cache, base_url=base_url, tracer=tracer)
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._semaphore = None
+        self._semaphore_loop = None
+
+    def _create_client(self, api_key, base_url):
+        # Retries are handled here, with the concurrency slot released while waiting
+        return AsyncOpenAI(api_key=api_key, base_url=base_url, max_retries=0)
+
+    def _get_semaphore(self):
+        # A semaphore is bound to one event loop, recreate it for a new loop
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._semaphore_loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._semaphore_loop = loop
+        return self._semaphore
+
+    async def aprocess_document(self, ocr_text, document_type, fields=None):
+        """
+        Process OCR text with LLM to extract and validate document info
+
+        Args:
+            ocr_text: Raw OCR text
+            document_type: Type of document
+            fields: Pre-extracted fields from Vision Transformer
+
+        Returns:
+            Structured JSON with extracted information
+        """
+        with self.tracer.span("llm.prompt_build"):
+            messages = self._build_messages(ocr_text, document_type, fields)
+
+        key, cached = self._cache_lookup(messages)
+        if cached is not None:
+            return cached
+
+        # Includes retries and time spent waiting for a concurrency slot
+        with self.tracer.span("llm.call", model=self.model) as span:
+            response = await self._create_with_retry(messages)
+            self._record_usage(span, response)
+
+        with self.tracer.span("llm.parse"):
+            return self._parse_response(response, key)
+
+    async def aprocess_documents(self, documents):
+        """
+        Process many documents concurrently, limited by max_concurrency
+
+        Args:
+            documents: Iterable of (ocr_text, document_type, fields) tuples
+
+        Returns:
+            List of results in input order
+        """
+        return await asyncio.gather(*(
+            self.aprocess_document(ocr_text, document_type, fields)
+            for ocr_text, document_type, fields in documents
+        ))
+
+    def process_document(self, ocr_text, document_type, fields=None):
+        """Blocking wrapper around aprocess_document for callers without an event loop"""
+        return asyncio.run(self.aprocess_document(ocr_text, document_type, fields))
+
+    async def _create_with_retry(self, messages):
+        attempt = 0
+        while True:
+            try:
+                async with self._get_semaphore():
+                    return await self.client.chat.completions.create(
+                        model=self.model,
+                        response_format={"type": "json_object"},  # noqa
+                        messages=messages,  # noqa
+                        temperature=0
+                    )
+            except _RETRYABLE_ERRORS as e:
+                if attempt >= self.max_retries:
+                    raise
+                await asyncio.sleep(self._retry_delay(e, attempt))
+                attempt += 1
+
+    def _retry_delay(self, error, attempt):
+        """Honour the server's Retry-After header, else exponential backoff with jitter"""
+        response = getattr(error, "response", None)
+        if response is not None:
+            retry_after = response.headers.get("retry-after")
+            try:
+                if retry_after is not None:
+                    return min(float(retry_after), self.backoff_max)
+            except ValueError:
+                pass
+
+        delay = min(self.backoff_base * (2 ** attempt), self.backoff_max)
+        return delay * random.uniform(0.5, 1.0)
+
+
 fields_mapping = {
     "№ онтракта": "contract_number",
     "дата заключения (дата заключения контракта)": "contract_initiation_date",
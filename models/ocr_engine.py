@@ -1,19 +1,203 @@
+import hashlib
+import json
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, wait
+from itertools import repeat
+
 import cv2
 import numpy as np
-from paddleocr import PaddleOCR
+
+from utils.tracing import NULL_TRACER
+
+PREPROCESS_PROFILES = ("none", "fast", "quality", "auto")
+
+# Version of the recognize() output layout, part of the cache key
+RESULT_FORMAT = 2
+# Version of the preprocessing filters and noise estimate, part of the cache key of preprocessed pages
+PREPROCESS_VERSION = 2
+
+# PaddleX sub-models of the OCR pipeline timed as their own spans:
+# (attribute of the sub-pipeline holding the model or None, model attribute, span name)
+TRACED_MODELS = (
+    ("doc_preprocessor_pipeline", "doc_ori_classify_model", "ocr.orientation"),
+    ("doc_preprocessor_pipeline", "doc_unwarping_model", "ocr.unwarp"),
+    (None, "text_det_model", "ocr.detect"),
+    (None, "textline_orientation_model", "ocr.textline_orientation"),
+    (None, "text_rec_model", "ocr.recognize"),
+)
+
+# OCR engine of the current pool worker process, created once by _init_worker
+_worker_engine = None
+
+
+def _check_profile(profile):
+    """Raise ValueError for anything but a known preprocess profile name"""
+    if profile not in PREPROCESS_PROFILES:
+        raise ValueError(f"Unknown preprocess profile '{profile}', expected one of {PREPROCESS_PROFILES}")
+    return profile
+
+
+def _init_worker(lang, preprocess_profile, noise_thresholds):
+    """Load a PaddleOCR instance once per pool worker process, configured like the parent engine"""
+    global _worker_engine
+    _worker_engine = OCREngine(lang=lang, preprocess_profile=preprocess_profile, noise_thresholds=noise_thresholds)
+    _worker_engine.warmup()
+
+
+def _warmup_worker():
+    """No-op task that forces a worker process to start and load its model"""
+    return _worker_engine is not None
+
+
+def _recognize_in_worker(image_path, preprocess):
+    return _worker_engine.recognize(image_path, preprocess=preprocess)
+
+
+def estimate_noise(gray, max_side=1024, edge_percentile=90):
+    """
+    Estimate the Gaussian noise sigma of a grayscale image (Immerkaer's method)
+
+    Text strokes dominate the Laplacian response of a page, so, as in Tai and
+    Yang's variant of the method, pixels on and next to Sobel edges (the top
+    10% of gradient magnitudes) are left out and only flat areas are measured.
+    Only a central crop of at most max_side x max_side pixels is measured,
+    which keeps the estimate in the millisecond range on full-page scans.
+    """
+    h, w = gray.shape[:2]
+    top, left = max(0, (h - max_side) // 2), max(0, (w - max_side) // 2)
+    crop = gray[top:top + max_side, left:left + max_side].astype(np.float32)
+    if crop.shape[0] < 3 or crop.shape[1] < 3:
+        return 0.0
+
+    gradient = np.abs(cv2.Sobel(crop, cv2.CV_32F, 1, 0)) + np.abs(cv2.Sobel(crop, cv2.CV_32F, 0, 1))
+    edges = (gradient > np.percentile(gradient, edge_percentile)).astype(np.uint8)
+    flat = cv2.dilate(edges, np.ones((3, 3), np.uint8))[1:-1, 1:-1] == 0
+    if not flat.any():
+        return 0.0
+
+    kernel = np.array([[1, -2, 1], [-2, 4, -2], [1, -2, 1]], dtype=np.float32)
+    response = np.abs(cv2.filter2D(crop, -1, kernel)[1:-1, 1:-1])[flat]
+    return float(np.sqrt(np.pi / 2) * response.sum() / (6 * response.size))
+
+
+class _TracedModel:
+    """
+    Stand-in for a PaddleX predictor that runs each call inside a tracer span
+
+    Predictors return lazy generators, so the results are collected inside the
+    span; the pipeline consumes them as a list either way.
+    """
+
+    def __init__(self, model, tracer, name):
+        self.model = model
+        self.tracer = tracer
+        self.name = name
+
+    def __call__(self, *args, **kwargs):
+        with self.tracer.span(self.name) as span:
+            results = list(self.model(*args, **kwargs))
+            span.set(items=len(results))
+        return results
+
+    def __getattr__(self, name):
+        return getattr(self.model, name)
+
+
+def _device_pipelines(pipeline):
+    """Pipelines behind a PaddleX auto-parallel wrapper: one per device, or the pipeline itself"""
+    if vars(pipeline).get("_multi_device_inference"):
+        return list(pipeline._executor.pipelines)
+    return [vars(pipeline).get("_pipeline", pipeline)]
+
+
+def trace_paddle_models(ocr, tracer):
+    """
+    Time orientation, unwarping, detection and recognition of a PaddleOCR
+    instance separately, by wrapping its sub-models in tracer spans
+
+    Args:
+        ocr: paddleocr.PaddleOCR
+        tracer: utils.tracing.Tracer
+
+    Returns:
+        Names of the spans that were set up; sub-models that are disabled or
+        missing in this PaddleOCR version are skipped
+    """
+    # PaddleOCR wraps the PaddleX pipeline, the document preprocessor is a pipeline of its own
+    wrapper = vars(ocr).get("paddlex_pipeline")
+    if wrapper is None:
+        return []
+
+    traced = set()
+    for pipeline in _device_pipelines(wrapper):
+        for holder_name, model_name, span_name in TRACED_MODELS:
+            holders = [pipeline]
+            if holder_name is not None:
+                holder = vars(pipeline).get(holder_name)
+                holders = _device_pipelines(holder) if holder is not None else []
+            for holder in holders:
+                model = vars(holder).get(model_name)
+                if model is None or isinstance(model, _TracedModel):
+                    continue
+                setattr(holder, model_name, _TracedModel(model, tracer, span_name))
+                traced.add(span_name)
+    return sorted(traced)
+
+
+def polys_to_array(polys):
+    """
+    Stack detection polygons into one float32 array of shape (N, 4, 2)
+
+    Quadrilaterals are stacked as they are. If the detector returned polygons
+    with other point counts, each one is replaced by its bounding rectangle.
+    """
+    if len(polys) == 0:
+        return np.zeros((0, 4, 2), dtype=np.float32)
+    try:
+        return np.asarray(polys, dtype=np.float32).reshape(len(polys), 4, 2)
+    except ValueError:
+        rects = np.empty((len(polys), 4, 2), dtype=np.float32)
+        for index, poly in enumerate(polys):
+            poly = np.asarray(poly, dtype=np.float32).reshape(-1, 2)
+            (x1, y1), (x2, y2) = poly.min(axis=0), poly.max(axis=0)
+            rects[index] = [[x1, y1], [x2, y1], [x2, y2], [x1, y2]]
+        return rects
 
 
 class OCREngine:
-    def __init__(self, lang='ru'):
+    def __init__(self, lang='ru', workers=0, cache=None, preprocess_profile="quality",
+                 noise_thresholds=(2.0, 6.0), tracer=None):
         """
         Initialize OCR engine with specific language support
 
         Args:
             lang: Language code ('ru', 'kz', etc.)
+            workers: Number of OCR worker processes, each with its own PaddleOCR
+                instance. 0 or 1 runs PaddleOCR in the current process.
+            cache: Optional cache with get/set (e.g. utils.cache.DiskCache) for OCR
+                results, keyed by page pixels and OCR configuration
+            preprocess_profile: Profile used when recognize() is called with preprocess=True
+            noise_thresholds: Estimated noise sigma below which the 'auto' profile
+                skips filtering, and above which it uses the 'quality' filter
+            tracer: Optional utils.tracing.Tracer receiving spans for preprocessing,
+                PaddleOCR inference with its orientation, unwarping, detection and
+                recognition models, and postprocessing of in-process calls
         """
         self.lang = lang
-        self.ocr = PaddleOCR(
-            lang=lang,  # Language model
+        self.workers = workers
+        self.cache = cache
+        self.preprocess_profile = _check_profile(preprocess_profile)
+        self.noise_thresholds = tuple(noise_thresholds)
+        self.tracer = tracer if tracer is not None else NULL_TRACER
+        # PaddleOCR (or the worker pool) is created on first use, see warmup()
+        self.ocr = None
+        self._pool = None
+        self._load_lock = threading.Lock()
+        # PaddleOCR predictors are not thread-safe, in-process calls are serialized
+        self._ocr_lock = threading.Lock()
+
+        self.params = dict(
             det_db_thresh=0.3,  # Lower threshold for detecting text in noisy images
             det_db_box_thresh=0.5,
             det_db_unclip_ratio=1.6,  # Larger value for tighter text boxes
@@ -35,27 +219,110 @@ class OCREngine:
             # textline_orientation_batch_size=8
         )
 
-    def preprocess_image(self, image_path):
-        """Apply preprocessing to improve OCR quality on noisy documents""" 
+    def warmup(self):
+        """Load PaddleOCR, or start every worker process, before the first page arrives"""
+        if self.workers > 1:
+            pool = self._get_pool()
+            wait([pool.submit(_warmup_worker) for _ in range(self.workers)])
+        else:
+            self._get_ocr()
+
+    def _get_ocr(self):
+        if self.ocr is None:
+            with self._load_lock:
+                if self.ocr is None:
+                    from paddleocr import PaddleOCR
+                    ocr = PaddleOCR(lang=self.lang, **self.params)
+                    if self.tracer.enabled:
+                        trace_paddle_models(ocr, self.tracer)
+                    self.ocr = ocr
+        return self.ocr
+
+    def _get_pool(self):
+        if self._pool is None:
+            with self._load_lock:
+                if self._pool is None:
+                    # Spawn instead of fork, Paddle does not survive forking a loaded process
+                    self._pool = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context("spawn"),
+                        initializer=_init_worker,
+                        initargs=(self.lang, self.preprocess_profile, self.noise_thresholds)
+                    )
+        return self._pool
+
+    def preprocess_image(self, image_path, profile="quality"):
+        """
+        Apply preprocessing to improve OCR quality on noisy documents
+
+        Args:
+            image_path: Path to image or image array
+            profile: 'none', 'fast' (resolution-aware median filter, then
+                binarization), 'quality' (binarization, then non-local means, the
+                original preprocessing) or 'auto' (picked from the estimated noise level)
+
+        Returns:
+            Preprocessed BGR image
+
+        Raises:
+            ValueError: profile is not one of PREPROCESS_PROFILES
+        """
+        _check_profile(profile)
+
         # Read image
         if isinstance(image_path, str):
             img = cv2.imread(image_path)
         else:
             img = image_path
 
+        if profile == "none":
+            return img
+
         # Convert to grayscale
         gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
 
-        # Apply adaptive thresholding for better contrast
+        if profile == "auto":
+            profile = self.choose_profile(gray)
+            if profile == "none":
+                return img
+
+        if profile == "quality":
+            # Apply adaptive thresholding for better contrast
+            thresh = cv2.adaptiveThreshold(
+                gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+                cv2.THRESH_BINARY, 11, 2
+            )
+
+            # Denoise
+            denoised = cv2.fastNlMeansDenoising(thresh, None, 10, 7, 21)
+            return cv2.cvtColor(denoised, cv2.COLOR_GRAY2BGR)
+
+        # Speckles grow with resolution, so do the median kernel and the threshold window
+        long_side = max(gray.shape)
+        denoised = cv2.medianBlur(gray, 3 if long_side <= 2000 else 5)
+        block_size = max(11, (long_side // 200) | 1)
         thresh = cv2.adaptiveThreshold(
-            gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
-            cv2.THRESH_BINARY, 11, 2
+            denoised, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+            cv2.THRESH_BINARY, block_size, 2
         )
+        return cv2.cvtColor(thresh, cv2.COLOR_GRAY2BGR)
 
-        # Denoise
-        denoised = cv2.fastNlMeansDenoising(thresh, None, 10, 7, 21)
+    def choose_profile(self, gray):
+        """Pick a preprocessing profile for a grayscale page from its noise level"""
+        sigma = estimate_noise(gray)
+        if sigma < self.noise_thresholds[0]:
+            return "none"
+        if sigma < self.noise_thresholds[1]:
+            return "fast"
+        return "quality"
 
-        return cv2.cvtColor(denoised, cv2.COLOR_GRAY2BGR)
+    def _resolve_profile(self, preprocess):
+        """Map the preprocess argument (bool or profile name) to a profile name"""
+        if preprocess is True:
+            return self.preprocess_profile
+        if not preprocess:
+            return "none"
+        return _check_profile(preprocess)
 
     def recognize(self, image_path, preprocess=False):
         """
@@ -63,39 +330,170 @@ class OCREngine:
 
         Args:
             image_path: Path to image or image array
-            preprocess: Whether to apply preprocessing
+            preprocess: Whether to apply preprocessing: a profile name ('none',
+                'fast', 'quality', 'auto') or True for the engine's default profile
 
         Returns:
-            Dictionary with OCR results
+            Dictionary with OCR results. 'boxes' holds the polygons of all
+            results as one (N, 4, 2) array; 'cache_hit' tells whether they came
+            from the cache instead of PaddleOCR.
         """
-        if preprocess:
-            img = self.preprocess_image(image_path)
-        else:
-            if isinstance(image_path, str):
-                img = cv2.imread(image_path)
-            else:
-                img = image_path
-
-        # Run OCR
-        results = self.ocr.ocr(img)
-        
+        preprocess = self._resolve_profile(preprocess)
+        if self.cache is None:
+            return self._recognize_uncached(image_path, preprocess)
+
+        with self.tracer.span("ocr.cache_lookup") as span:
+            img = self._load_image(image_path)
+            key = self.cache_key(img, preprocess)
+            cached = self._cache_get(key)
+            span.set(cache_hit=cached is not None)
+        if cached is not None:
+            return cached
+
+        result = self._recognize_uncached(img, preprocess)
+        self._cache_set(key, result)
+        return result
+
+    def _cache_get(self, key):
+        cached = self.cache.get(key)
+        if cached is not None:
+            cached['boxes'] = np.asarray(cached['boxes'], dtype=np.float32).reshape(-1, 4, 2)
+            cached['cache_hit'] = True
+        return cached
+
+    def _cache_set(self, key, result):
+        # The cache stores JSON, so the polygon array goes in as nested lists
+        self.cache.set(key, dict(result, boxes=result['boxes'].tolist()))
+        result['cache_hit'] = False
+
+    def cache_key(self, img, preprocess=False):
+        """
+        Content address of an OCR result: page pixels plus everything that changes the output
+
+        Args:
+            img: Image array
+            preprocess: Preprocessing profile applied
+
+        Returns:
+            Hex digest identifying the OCR result
+        """
+        config = json.dumps({
+            'format': RESULT_FORMAT,
+            'lang': self.lang,
+            'params': self.params,
+            'preprocess': preprocess,
+            'preprocess_version': PREPROCESS_VERSION if preprocess != "none" else None,
+            'noise_thresholds': self.noise_thresholds if preprocess == "auto" else None
+        }, sort_keys=True)
+
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update(config.encode('utf-8'))
+        digest.update(f"{img.shape}{img.dtype}".encode('utf-8'))
+        digest.update(np.ascontiguousarray(img).data)
+        return digest.hexdigest()
+
+    def _load_image(self, image_path):
+        if isinstance(image_path, str):
+            img = cv2.imread(image_path)
+            if img is None:
+                raise ValueError(f"Image at {image_path} could not be loaded.")
+            return img
+        return image_path
+
+    def _recognize_uncached(self, image_path, preprocess):
+        if self.workers > 1:
+            # Stages inside the worker process are not traced, only the round trip
+            with self.tracer.span("ocr.worker"):
+                return self._get_pool().submit(_recognize_in_worker, image_path, preprocess).result()
+
+        return self._recognize_batch([image_path], preprocess)[0]
+
+    def _recognize_batch(self, image_paths, preprocess):
+        """Run PaddleOCR in this process on several pages with one predict call"""
+        with self.tracer.span("ocr.preprocess", profile=preprocess, batch=len(image_paths)):
+            images = []
+            for image_path in image_paths:
+                if preprocess and preprocess != "none":
+                    images.append(self.preprocess_image(image_path, preprocess))
+                else:
+                    if isinstance(image_path, str):
+                        images.append(cv2.imread(image_path))
+                    else:
+                        images.append(image_path)
+
+        # Run OCR. Orientation, unwarping, detection and recognition inside this
+        # call have their own child spans, see trace_paddle_models()
+        with self._ocr_lock, self.tracer.span("ocr.predict", batch=len(images)):
+            results = self._get_ocr().ocr(images)
+
+        with self.tracer.span("ocr.postprocess", batch=len(images)):
+            return [self._structure_results([result]) for result in results]
+
+    def _structure_results(self, results):
+        """Turn PaddleOCR output into the recognize() result layout"""
         structured_results = []
+        boxes = np.zeros((0, 4, 2), dtype=np.float32)
         if results and results[0]:
             res_dict = results[0]
             
-            boxes = res_dict.get('dt_polys', [])
             texts = res_dict.get('rec_texts', [])
             scores = res_dict.get('rec_scores', [])
+            # All polygons stay in one (N, 4, 2) array, row i belongs to results[i]
+            boxes = polys_to_array(res_dict.get('dt_polys', []))[:len(texts)]
 
-            for box, text, score in zip(boxes, texts, scores):
+            for text, score in zip(texts, scores):
                 structured_results.append({
                     'text': text,
                     'confidence': float(score),
-                    'box': box.tolist(), # convert numpy array to list
                     'page': 0 # Assuming single page
                 })
 
         return {
             'results': structured_results,
+            'boxes': boxes,
             'raw_text': ' '.join([r['text'] for r in structured_results])
         }
+
+    def recognize_many(self, image_paths, preprocess=False):
+        """
+        Perform OCR on several pages, in parallel when a worker pool is configured
+
+        Without a pool the pages that are not cached go to PaddleOCR as one
+        batch, so its predictors see all of them in one call.
+
+        Args:
+            image_paths: List of paths to images or image arrays
+            preprocess: Preprocessing profile name, or True for the default profile
+
+        Returns:
+            List of dictionaries with OCR results, in page order
+        """
+        preprocess = self._resolve_profile(preprocess)
+        if not image_paths:
+            return []
+
+        if self.cache is None:
+            return self._recognize_pages(image_paths, preprocess)
+
+        # Serve cache hits directly and send only the misses to PaddleOCR
+        images = [self._load_image(image_path) for image_path in image_paths]
+        keys = [self.cache_key(img, preprocess) for img in images]
+        results = [self._cache_get(key) for key in keys]
+        misses = [index for index, result in enumerate(results) if result is None]
+
+        computed = self._recognize_pages([images[i] for i in misses], preprocess) if misses else []
+        for index, result in zip(misses, computed):
+            self._cache_set(keys[index], result)
+            results[index] = result
+        return results
+
+    def _recognize_pages(self, image_paths, preprocess):
+        if self.workers > 1:
+            return list(self._get_pool().map(_recognize_in_worker, image_paths, repeat(preprocess)))
+        return self._recognize_batch(image_paths, preprocess)
+
+    def close(self):
+        """Shut down OCR worker processes, if any"""
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
@@ -1,15 +1,86 @@
 import os
 import argparse
-from utils.pipeline import DocumentPipeline
+from pathlib import Path
+from utils.page_analysis import PageAnalyzer
+from utils.pipeline import DocumentPipeline, SUPPORTED_EXTENSIONS
+from utils.tracing import Tracer
 import json
 
 
+def save_result(result, output_path):
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+
+
+def run_single(pipeline, image_path, output_path):
+    # Process document
+    print(f"Processing document: {image_path}")
+    result = pipeline.process(image_path)
+
+    # Save results
+    save_result(result, output_path)
+
+    print(f"Results saved to: {output_path}")
+    print(f"Document type: {result['document_type']}")
+    print(f"Confidence: {result['confidence']:.2%}")
+    print(f"Processing time: {result['processing_times']['total']:.2f}s")
+
+
+def run_batch(pipeline, input_dir, output_dir, workers):
+    input_dir = Path(input_dir)
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    image_paths = sorted(str(path) for path in input_dir.iterdir()
+                         if path.suffix.lower() in SUPPORTED_EXTENSIONS)
+    print(f"Processing {len(image_paths)} documents from {input_dir} with {workers} worker(s)")
+
+    failed = 0
+    for image_path, result, error in pipeline.process_many(image_paths, workers=workers):
+        name = Path(image_path).name
+        if error is not None:
+            failed += 1
+            print(f"  {name}: failed: {error}")
+            continue
+
+        output_path = output_dir / f"{Path(image_path).stem}.json"
+        save_result(result, output_path)
+        print(f"  {name}: {result['document_type']}, {result['pages']} page(s), "
+              f"{result['processing_times']['total']:.2f}s -> {output_path}")
+
+    print(f"Done: {len(image_paths) - failed} succeeded, {failed} failed")
+    return failed
+
+
 def main():
     parser = argparse.ArgumentParser(description='Banking Document OCR')
-    parser.add_argument('--image', required=True, help='Path to document image')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--image', help='Path to document image')
+    source.add_argument('--input-dir', help='Directory of documents to process in batch mode')
     parser.add_argument('--lang', default='ru', choices=['ru', 'kz'], help='Language code')
     parser.add_argument('--output', default='output.json', help='Output JSON file')
+    parser.add_argument('--output-dir', default='output', help='Output directory for batch mode')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Number of documents processed concurrently in batch mode')
     parser.add_argument('--no-gpu', action='store_true', help='Disable GPU')
+    parser.add_argument('--ocr-workers', type=int, default=0,
+                        help='Number of OCR worker processes for multi-page documents')
+    parser.add_argument('--layout-backend', default=os.environ.get("LAYOUT_BACKEND", "torch"),
+                        choices=['torch', 'torch-int8', 'onnx'], help='LayoutLMv3 inference backend')
+    parser.add_argument('--no-text-layer', action='store_true',
+                        help='OCR every PDF page, even when it has an embedded text layer')
+    parser.add_argument('--preprocess', default='none', choices=['none', 'fast', 'quality', 'auto'],
+                        help='OCR image preprocessing; auto picks a filter from the estimated noise level')
+    parser.add_argument('--llm-token-budget', type=int, default=None,
+                        help='Trim the LLM text to about this many tokens, keeping header, parties, sums and signature')
+    parser.add_argument('--flat-text', action='store_true',
+                        help='Send the LLM the page texts as OCR returned them, without reading-order assembly')
+    parser.add_argument('--cache-dir', default=os.environ.get("PIPELINE_CACHE_DIR"),
+                        help='Directory for the persistent OCR and LLM result caches')
+    parser.add_argument('--trace', default=None,
+                        help='Write per-page stage and model spans to this JSON lines file')
+    parser.add_argument('--metrics', default=None,
+                        help='Write per-stage latency, memory and token metrics in Prometheus text format')
 
     args = parser.parse_args()
 
@@ -17,25 +88,40 @@ def main():
     if not os.environ.get("OPENAI_API_KEY"):
         print("Warning: OPENAI_API_KEY environment variable not set")
 
-    # Initialize pipeline
+    tracer = Tracer() if args.trace or args.metrics else None
+
+    # Initialize pipeline once, models stay loaded for every document
     pipeline = DocumentPipeline(
         lang=args.lang,
-        llm_api_key=os.environ.get("OPENAI_API_KEY")
+        llm_api_key=os.environ.get("OPENAI_API_KEY"),
+        ocr_workers=args.ocr_workers,
+        layout_backend=args.layout_backend,
+        page_analyzer=PageAnalyzer(use_text_layer=not args.no_text_layer),
+        preprocess=args.preprocess,
+        tracer=tracer,
+        text_assembly=not args.flat_text,
+        llm_token_budget=args.llm_token_budget,
+        ocr_cache_dir=os.path.join(args.cache_dir, 'ocr') if args.cache_dir else None,
+        llm_cache_dir=os.path.join(args.cache_dir, 'llm') if args.cache_dir else None
     )
 
-    # Process document
-    print(f"Processing document: {args.image}")
-    result = pipeline.process(args.image)
-
-    # Save results
-    with open(args.output, 'w', encoding='utf-8') as f:
-        json.dump(result, f, ensure_ascii=False, indent=2)
-
-    print(f"Results saved to: {args.output}")
-    print(f"Document type: {result['document_type']}")
-    print(f"Confidence: {result['confidence']:.2%}")
-    print(f"Processing time: {result['processing_times']['total']:.2f}s")
+    try:
+        if args.input_dir:
+            failed = run_batch(pipeline, args.input_dir, args.output_dir, args.workers)
+            if failed:
+                raise SystemExit(1)
+        else:
+            run_single(pipeline, args.image, args.output)
+    finally:
+        pipeline.close()
+        if args.trace:
+            tracer.write_jsonl(args.trace)
+            print(f"Trace saved to: {args.trace}")
+        if args.metrics:
+            with open(args.metrics, 'w', encoding='utf-8') as f:
+                f.write(tracer.prometheus_text())
+            print(f"Metrics saved to: {args.metrics}")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,79 @@
+import threading
+
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("httpx")
+pytest.importorskip("uvicorn")
+from fastapi.testclient import TestClient
+
+from app.api_server import create_app
+
+
+class FakePipeline:
+    def __init__(self, error=None):
+        self.error = error
+        self.warmed_up = threading.Event()
+        self.release = threading.Event()
+
+    def warmup(self):
+        self.warmed_up.set()
+        if self.error is not None:
+            raise self.error
+
+    def process(self, image_path, stop_event=None, on_event=None):
+        self.release.wait(5)
+        return {"document_type": "contract"}
+
+    def close(self):
+        self.release.set()
+
+
+def upload(client):
+    return client.post("/v1/documents", files={"file": ("contract.png", b"image", "image/png")})
+
+
+def test_ready_after_warmup():
+    pipeline = FakePipeline()
+    with TestClient(create_app(pipeline)) as client:
+        assert pipeline.warmed_up.wait(5)
+        for _ in range(50):
+            response = client.get("/ready")
+            if response.status_code == 200:
+                break
+            threading.Event().wait(0.05)
+        assert response.status_code == 200
+
+
+def test_failed_warmup_is_reported():
+    pipeline = FakePipeline(error=OSError("model weights not found"))
+    with TestClient(create_app(pipeline)) as client:
+        assert pipeline.warmed_up.wait(5)
+        for _ in range(50):
+            response = client.get("/ready")
+            if response.json()["status"] != "warming up":
+                break
+            threading.Event().wait(0.05)
+        assert response.status_code == 503
+        assert response.json() == {"status": "failed", "error": "model weights not found"}
+        assert client.get("/healthz").json()["ready"] is False
+
+
+def test_full_queue_answers_429_with_retry_after():
+    pipeline = FakePipeline()
+    with TestClient(create_app(pipeline, concurrency=1, max_pending=1, retry_after=7)) as client:
+        assert upload(client).status_code == 202
+
+        response = upload(client)
+        assert response.status_code == 429
+        assert response.headers["Retry-After"] == "7"
+        pipeline.release.set()
+
+
+def test_submit_after_close_answers_503():
+    pipeline = FakePipeline()
+    app = create_app(pipeline)
+    with TestClient(app) as client:
+        app.state.jobs.close()
+        assert upload(client).status_code == 503
+        assert app.state.jobs.jobs == {}
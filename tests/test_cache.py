@@ -0,0 +1,79 @@
+from concurrent.futures import ProcessPoolExecutor
+from types import SimpleNamespace
+
+import utils.cache
+from utils.cache import DiskCache
+
+
+def fill(path, prefix, count):
+    """Write entries from another process; returns what that process reads back"""
+    cache = DiskCache(path)
+    for index in range(count):
+        cache.set(f"{prefix}-{index}", {"index": index})
+    return [cache.get(f"{prefix}-{index}") for index in range(count)]
+
+
+def test_least_recently_used_entry_is_evicted_at_max_entries(tmp_path):
+    cache = DiskCache(str(tmp_path), max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # b is now the least recently used
+
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.stats()["entries"] == 2
+
+
+def test_least_recently_used_entries_are_evicted_at_max_bytes(tmp_path):
+    value = "x" * 100
+    cache = DiskCache(str(tmp_path), max_bytes=350)
+    for key in "abc":
+        cache.set(key, value)
+    cache.get("a")
+
+    cache.set("d", value)
+
+    assert [key for key in "abcd" if cache.get(key) is not None] == ["a", "c", "d"]
+    assert cache.stats()["size_bytes"] <= 350
+
+
+def test_processes_share_one_database(tmp_path):
+    path = str(tmp_path)
+    cache = DiskCache(path)
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        results = list(executor.map(fill, [path, path], ["first", "second"], [50, 50]))
+
+    assert all(result == [{"index": index} for index in range(50)] for result in results)
+    assert cache.get("first-49") == {"index": 49}
+    assert cache.get("second-0") == {"index": 0}
+    assert cache.stats()["entries"] == 100
+
+
+def test_entries_expire_after_ttl(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(utils.cache, "time", SimpleNamespace(time=lambda: now[0]))
+    cache = DiskCache(str(tmp_path), ttl=60)
+    cache.set("old", 1)
+    now[0] += 30
+    cache.set("new", 2)
+
+    now[0] += 40  # old is 70 s old, new is 40 s old
+    assert cache.get("old") is None
+    assert cache.get("new") == 2
+    assert cache.stats()["entries"] == 1
+
+
+def test_hit_and_miss_counters(tmp_path):
+    cache = DiskCache(str(tmp_path))
+    cache.set("a", {"data": 1})
+
+    assert cache.get("a") == {"data": 1}
+    assert cache.get("a") == {"data": 1}
+    assert cache.get("b") is None
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (2, 1, 1)
+    assert stats["size_bytes"] == len(b'{"data": 1}')
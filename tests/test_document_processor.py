@@ -0,0 +1,125 @@
+import json
+
+import pytest
+
+np = pytest.importorskip("numpy")
+torch = pytest.importorskip("torch")
+transformers = pytest.importorskip("transformers")
+Image = pytest.importorskip("PIL.Image")
+
+from models.document_processor import DocumentProcessor  # noqa: E402
+
+CHARACTERS = "abcdefghijklmnopqrstuvwxyzабвгдежзийклмнопрстуфхцчшщъыьэюя0123456789.,№"
+
+
+def save_tiny_checkpoint(path, model_class=None):
+    """Save a randomly initialized LayoutLMv3 small enough to build offline"""
+    vocab = {"<s>": 0, "<pad>": 1, "</s>": 2, "<unk>": 3, "<mask>": 4, "Ġ": 5}
+    for char in CHARACTERS:
+        vocab.setdefault(char, len(vocab))
+        vocab.setdefault("Ġ" + char, len(vocab))
+    (path / "vocab.json").write_text(json.dumps(vocab), encoding="utf-8")
+    (path / "merges.txt").write_text("#version: 0.2\n" + "".join(f"Ġ {char}\n" for char in CHARACTERS),
+                                     encoding="utf-8")
+
+    tokenizer = transformers.LayoutLMv3TokenizerFast(vocab_file=str(path / "vocab.json"),
+                                                     merges_file=str(path / "merges.txt"))
+    transformers.LayoutLMv3Processor(transformers.LayoutLMv3ImageProcessor(apply_ocr=False),
+                                     tokenizer).save_pretrained(path)
+    config = transformers.LayoutLMv3Config(
+        vocab_size=len(vocab), hidden_size=48, coordinate_size=8, shape_size=8, num_hidden_layers=2,
+        num_attention_heads=2, intermediate_size=37, max_position_embeddings=600, num_labels=5
+    )
+    torch.manual_seed(0)
+    model = (model_class or transformers.LayoutLMv3Model)(config)
+    model.save_pretrained(path)
+    return str(path), model
+
+
+@pytest.fixture(scope="module")
+def tiny_checkpoint(tmp_path_factory):
+    return save_tiny_checkpoint(tmp_path_factory.mktemp("layoutlmv3"))[0]
+
+
+def ocr_page(word_count):
+    boxes = np.array([[[10, 10 + 3 * i], [60, 10 + 3 * i], [60, 12 + 3 * i], [10, 12 + 3 * i]]
+                      for i in range(word_count)], dtype=np.float32)
+    return {"results": [{"text": f"слово{i}"} for i in range(word_count)], "boxes": boxes}
+
+
+def test_overflowing_and_short_page_in_one_batch(tiny_checkpoint):
+    processor = DocumentProcessor(tiny_checkpoint, device="cpu", max_length=64, stride=16)
+    image = Image.new("RGB", (400, 600), "white")
+    long_page, short_page = ocr_page(120), ocr_page(3)
+
+    analyses = processor.process_documents([image, image], [long_page, short_page])
+
+    assert len(analyses) == 2
+    for analysis in analyses:
+        assert set(analysis) == {"document_type", "confidence", "fields"}
+        assert 0.0 <= analysis["confidence"] <= 1.0
+    # Each page is analysed the same alone as next to the other one
+    assert analyses[1] == processor.process_document(image, short_page)
+    long_words = {word for spans in analyses[0]["fields"].values() for span in spans for word in span.split()}
+    assert long_words <= {item["text"] for item in long_page["results"]}
+
+
+def test_int8_backend_matches_torch(tiny_checkpoint):
+    from compare_backends import compare
+
+    image = Image.new("RGB", (400, 600), "white")
+    pages = [ocr_page(120), ocr_page(3), ocr_page(40)]
+    reference = DocumentProcessor(tiny_checkpoint, device="cpu", max_length=64, stride=16)
+    quantized = DocumentProcessor(tiny_checkpoint, backend="torch-int8", max_length=64, stride=16)
+
+    parity = compare(reference.process_documents([image] * 3, pages),
+                     quantized.process_documents([image] * 3, pages))
+
+    # Token labels of random weights sit on near ties, so only the document level is compared
+    assert parity["document_type_match"] == 1.0, parity
+    assert parity["max_confidence_diff"] < 0.01
+
+
+def test_onnx_export_keeps_the_batch_axis_dynamic(tiny_checkpoint, tmp_path):
+    pytest.importorskip("onnxruntime")
+    pytest.importorskip("onnxscript")
+    from compare_backends import compare
+
+    image = Image.new("RGB", (400, 600), "white")
+    pages = [ocr_page(120), ocr_page(3), ocr_page(40)]
+    reference = DocumentProcessor(tiny_checkpoint, device="cpu", max_length=64, stride=16)
+    exported = DocumentProcessor(tiny_checkpoint, backend="onnx", device="cpu", max_length=64, stride=16,
+                                 onnx_path=str(tmp_path / "model.onnx"))
+
+    for node in exported.session.get_inputs() + exported.session.get_outputs():
+        assert node.shape[0] == "batch", (node.name, node.shape)
+    parity = compare(reference.process_documents([image] * 3, pages),
+                     exported.process_documents([image] * 3, pages))
+    assert parity["document_type_match"] == 1.0, parity
+
+
+def test_untrained_heads_are_seeded_with_a_warning(tiny_checkpoint, caplog):
+    with caplog.at_level("WARNING", logger="models.document_processor"):
+        processor = DocumentProcessor(tiny_checkpoint, device="cpu")
+
+    assert "doc_head, token_head" in caplog.text
+    again = DocumentProcessor(tiny_checkpoint, device="cpu")
+    assert torch.equal(processor.model.doc_head.out_proj.weight, again.model.doc_head.out_proj.weight)
+
+
+@pytest.mark.parametrize("model_class, head", [
+    ("LayoutLMv3ForSequenceClassification", "doc_head"),
+    ("LayoutLMv3ForTokenClassification", "token_head"),
+])
+def test_fine_tuned_head_weights_are_loaded(tmp_path, caplog, model_class, head):
+    path, fine_tuned = save_tiny_checkpoint(tmp_path, getattr(transformers, model_class))
+
+    with caplog.at_level("WARNING", logger="models.document_processor"):
+        processor = DocumentProcessor(path, device="cpu")
+
+    loaded = getattr(processor.model, head).state_dict()
+    assert loaded.keys() == fine_tuned.classifier.state_dict().keys()
+    for name, weight in fine_tuned.classifier.state_dict().items():
+        assert torch.equal(loaded[name], weight)
+    untrained = {"doc_head": "token_head", "token_head": "doc_head"}[head]
+    assert f"No trained weights for {untrained} in" in caplog.text
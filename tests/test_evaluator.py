@@ -0,0 +1,182 @@
+from datetime import date
+from decimal import Decimal
+
+import pytest
+
+pytest.importorskip("rapidfuzz")
+pytest.importorskip("pandas")
+
+from utils.evaluator import (  # noqa: E402
+    LATENCY_STAGES,
+    CorpusEvaluator,
+    OCREvaluator,
+    normalize_amount,
+    normalize_currency,
+    normalize_date,
+    text_error_counts,
+)
+
+TEXT_PAIRS = [
+    ("Договор поставки № 12/34 от 17.12.2022", "Договор поставкн № 12/34 от 17.12.2022"),
+    ("ТОО Mas Shelby в лице директора", "ТОО Mas Shelby в в лице директора"),
+    ("сумма 3 209 315,71 RUB", "сумма 3209 315,71 руб"),
+    ("a b c d e f", "f e d c b a"),
+    ("one two", ""),
+    ("", "ocr noise"),
+    ("", ""),
+]
+
+
+def dp_word_errors(reference, hypothesis):
+    """Word edit distance as the evaluator computed it before rapidfuzz"""
+    ref_words, hyp_words = reference.split(), hypothesis.split()
+    d = [[0] * (len(hyp_words) + 1) for _ in range(len(ref_words) + 1)]
+    for i in range(len(ref_words) + 1):
+        d[i][0] = i
+    for j in range(len(hyp_words) + 1):
+        d[0][j] = j
+    for i in range(1, len(ref_words) + 1):
+        for j in range(1, len(hyp_words) + 1):
+            if ref_words[i - 1] == hyp_words[j - 1]:
+                d[i][j] = d[i - 1][j - 1]
+            else:
+                d[i][j] = min(d[i - 1][j], d[i][j - 1], d[i - 1][j - 1]) + 1
+    return d[-1][-1]
+
+
+def dp_char_errors(reference, hypothesis):
+    previous = list(range(len(hypothesis) + 1))
+    for i, ref_char in enumerate(reference, 1):
+        current = [i]
+        for j, hyp_char in enumerate(hypothesis, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ref_char != hyp_char)))
+        previous = current
+    return previous[-1]
+
+
+def dp_rate(errors, length):
+    if length == 0:
+        return 1.0 if errors > 0 else 0.0
+    return errors / length
+
+
+@pytest.mark.parametrize("value", ["1 000,50", "1,000.50", "1.000,50", "1000.50", "1 000.50 RUB", "1000,5", 1000.5])
+def test_amount_formats(value):
+    assert normalize_amount(value) == Decimal("1000.50")
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("1,000", Decimal("1000")),
+    ("1.000", Decimal("1000")),
+    ("3 209 315,71", Decimal("3209315.71")),
+    ("3,209,315.71", Decimal("3209315.71")),
+    ("12,5", Decimal("12.5")),
+    ("около миллиона", None),
+    (True, None),
+])
+def test_amount_separators(value, expected):
+    assert normalize_amount(value) == expected
+
+
+@pytest.mark.parametrize("value", [
+    "17.12.2022", "17.12.22", "17/12/2022", "17-12-2022", "2022-12-17",
+    "«17» декабря 2022 г.", "17 декабря 2022 года", "17 декабрь 2022",
+])
+def test_date_variants(value):
+    assert normalize_date(value) == date(2022, 12, 17)
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("5 мая 2023", date(2023, 5, 5)),
+    ("1 марта 2024", date(2024, 3, 1)),
+    ("31.02.2022", None),
+    ("до полного исполнения", None),
+])
+def test_date_edge_cases(value, expected):
+    assert normalize_date(value) == expected
+
+
+def test_currency_names_and_lists():
+    assert normalize_currency("российских рублей") == frozenset({"RUB"})
+    assert normalize_currency("EUR, USD") == frozenset({"EUR", "USD"})
+    assert normalize_currency("тенге и доллары США") == frozenset({"KZT", "USD"})
+    assert normalize_currency("тугрики") is None
+
+
+def test_match_fields():
+    reference = {"contract_number": "12/34", "contract_date": "17.12.2022", "contract_sum": "1 000,50",
+                 "contract_sum_currency": "RUB", "counterparty_name": "ТОО Mas Shelby",
+                 "counterparty_country": "BY.Беларусь", "subject": "Поставка оборудования"}
+    generated = {"contract_number": "12/34", "contract_date": "2022-12-17", "contract_sum": 1000.5,
+                 "contract_sum_currency": "рубли", "counterparty_name": "ТОО \"Mas Shelby\"",
+                 "counterparty_country": "BY. Республика Беларусь", "subject": "Поставка товара"}
+
+    result = OCREvaluator().match_fields(reference, generated)
+
+    matches = {field: field_result["match"] for field, field_result in result["fields"].items()}
+    assert matches == {"contract_number": True, "contract_date": True, "contract_sum": True,
+                       "contract_sum_currency": None, "counterparty_name": False,
+                       "counterparty_country": True, "subject": None}
+    assert result["matched_fields_count"] == 4
+    assert result["undecided"] == ["contract_sum_currency", "subject"]
+    assert result["is_perfect_match"] is False
+
+
+def test_match_fields_perfect_and_extra_fields():
+    evaluator = OCREvaluator()
+    reference = {"contract_number": "1", "contract_expiration_date": "-"}
+    assert evaluator.match_fields(reference, {"contract_number": "1"})["is_perfect_match"] is True
+    assert evaluator.match_fields(reference, {"contract_number": "1", "bank": "X"})["is_perfect_match"] is False
+
+
+@pytest.mark.parametrize("reference, hypothesis", TEXT_PAIRS)
+def test_error_rates_match_dynamic_programming(reference, hypothesis):
+    evaluator = OCREvaluator()
+    ref_words = reference.split()
+    assert evaluator.calculate_wer(reference, hypothesis) == dp_rate(dp_word_errors(reference, hypothesis),
+                                                                      len(ref_words))
+    assert evaluator.calculate_cer(reference, hypothesis) == dp_rate(dp_char_errors(reference, hypothesis),
+                                                                      len(reference))
+
+
+@pytest.mark.parametrize("workers, chunksize", [(1, 16), (2, 2)])
+def test_batch_error_rates_match_single_pairs(workers, chunksize):
+    evaluator = OCREvaluator()
+    references = [reference for reference, _ in TEXT_PAIRS]
+    hypotheses = [hypothesis for _, hypothesis in TEXT_PAIRS]
+
+    frame = evaluator.batch_error_rates(references, hypotheses, ids=range(len(TEXT_PAIRS)),
+                                        workers=workers, chunksize=chunksize)
+
+    assert list(frame["word_errors"]) == [dp_word_errors(r, h) for r, h in TEXT_PAIRS]
+    assert list(frame["char_errors"]) == [dp_char_errors(r, h) for r, h in TEXT_PAIRS]
+    assert list(frame["wer"]) == [evaluator.calculate_wer(r, h) for r, h in TEXT_PAIRS]
+    assert list(frame["cer"]) == [evaluator.calculate_cer(r, h) for r, h in TEXT_PAIRS]
+
+    corpus = evaluator.corpus_error_rates(frame)
+    assert corpus["wer"] == sum(frame["word_errors"]) / sum(frame["ref_words"])
+    assert corpus["documents"] == len(TEXT_PAIRS)
+
+
+def document_row(name, transcript_pair=None):
+    row = {"document": name, "pages": 1, "text_layer_pages": 0, "ocr_value_recall": 1.0,
+           "layout_type_correct": True, "layout_confidence": 0.5, "layout_field_recall": None,
+           "llm_fields": 1, "llm_matched": 1, "llm_undecided": 0, "llm_perfect": True,
+           "llm_field_matches": {"contract_number": True}, "llm_input_tokens": None,
+           **{f"{stage}_s": 1.0 for stage in LATENCY_STAGES}}
+    if transcript_pair is not None:
+        row.update(text_error_counts(*transcript_pair))
+    return row
+
+
+def test_corpus_report_scores_like_batch_error_rates():
+    evaluator = OCREvaluator()
+    rows = [document_row(f"doc{index}.pdf", pair) for index, pair in enumerate(TEXT_PAIRS)]
+    rows.append(document_row("untranscribed.pdf"))
+
+    report = CorpusEvaluator(pipeline=None, evaluator=evaluator).report(rows)
+
+    expected = evaluator.corpus_error_rates(evaluator.batch_error_rates(
+        [reference for reference, _ in TEXT_PAIRS], [hypothesis for _, hypothesis in TEXT_PAIRS], workers=1))
+    ocr = report["stages"]["ocr"]
+    assert {key: ocr[key] for key in expected} == expected
@@ -0,0 +1,93 @@
+import threading
+
+import pytest
+
+from utils.jobs import DocumentJob, JobManager
+from utils.pipeline import ProcessingCancelled
+
+
+class FakePipeline:
+    """Reports a page, then waits for release; records whether the file was there while reading"""
+
+    def __init__(self, block=False):
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.block = block
+        self.file_present = None
+        self.calls = 0
+
+    def process(self, image_path, stop_event=None, on_event=None):
+        self.calls += 1
+        self.started.set()
+        if self.block:
+            self.release.wait(5)
+        with open(image_path, "rb"):
+            self.file_present = True
+        on_event({"event": "page", "page": 1})
+        if stop_event is not None and stop_event.is_set():
+            raise ProcessingCancelled()
+        return {"document_type": "contract"}
+
+
+def upload(tmp_path):
+    path = tmp_path / "upload.png"
+    path.write_bytes(b"image")
+    return path
+
+
+def test_raising_listener_is_dropped(tmp_path):
+    events = []
+
+    def closed_stream(event):
+        raise RuntimeError("Event loop is closed")
+
+    job = DocumentJob(FakePipeline(), str(upload(tmp_path)), on_event=closed_stream)
+    job._listeners.append(events.append)
+
+    assert job.run() == "done"
+    assert closed_stream not in job._listeners
+    assert [event["event"] for event in events] == ["started", "page", "done"]
+
+
+def test_cancel_while_queued_leaves_cleanup_to_the_worker(tmp_path):
+    path = upload(tmp_path)
+    pipeline = FakePipeline()
+    job = DocumentJob(pipeline, str(path), delete_file=True)
+
+    job.cancel()
+    assert job.status == "cancelled"
+    assert path.exists()
+
+    assert job.run() == "cancelled"
+    assert pipeline.calls == 0
+    assert not path.exists()
+
+
+def test_cancel_while_running_keeps_the_file_until_the_worker_is_done(tmp_path):
+    path = upload(tmp_path)
+    pipeline = FakePipeline(block=True)
+    job = DocumentJob(pipeline, str(path), delete_file=True)
+    worker = threading.Thread(target=job.run)
+    worker.start()
+
+    assert pipeline.started.wait(5)
+    job.cancel()
+    assert job.status == "running"
+    assert path.exists()
+
+    pipeline.release.set()
+    worker.join(5)
+    assert pipeline.file_present
+    assert job.status == "cancelled"
+    assert not path.exists()
+
+
+def test_submit_after_close_raises(tmp_path):
+    path = upload(tmp_path)
+    manager = JobManager(FakePipeline())
+    manager.close()
+
+    with pytest.raises(RuntimeError):
+        manager.submit(str(path), delete_file=True)
+    assert not manager.jobs
+    assert manager.pending() == 0
@@ -0,0 +1,75 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("openai")
+pytest.importorskip("dotenv")
+from openai import RateLimitError  # noqa: E402
+
+from models.llm_processor import AsyncLLMProcessor, LLMProcessor  # noqa: E402
+from utils.cache import DiskCache  # noqa: E402
+from utils.llm_stub_server import LLMStubServer  # noqa: E402
+
+DOCUMENTS = [(f"Договор № {number}", 1, {}) for number in range(12)]
+
+
+def test_concurrency_cap_and_rate_limit_retries():
+    with LLMStubServer(latency=0.05, rate_limit_every=4, retry_after=0) as stub:
+        processor = AsyncLLMProcessor(api_key="test", base_url=stub.base_url, max_concurrency=3,
+                                      backoff_base=0.01)
+        results = asyncio.run(processor.aprocess_documents(DOCUMENTS))
+
+    assert all(result["success"] for result in results)
+    # Every 429 was retried once more, nothing else was sent
+    assert stub.rate_limited >= 3
+    assert stub.requests == len(DOCUMENTS) + stub.rate_limited
+    assert stub.max_in_flight == 3
+
+
+def test_retry_after_header_is_honoured():
+    with LLMStubServer(rate_limit_every=2, retry_after=0.3) as stub:
+        processor = AsyncLLMProcessor(api_key="test", base_url=stub.base_url, backoff_base=10.0)
+        processor.process_document(*DOCUMENTS[0])
+
+        start = time.perf_counter()
+        result = processor.process_document(*DOCUMENTS[1])
+        elapsed = time.perf_counter() - start
+
+    assert result["success"]
+    assert stub.rate_limited == 1
+    # Waited for Retry-After, not for the 10 s exponential backoff
+    assert 0.3 <= elapsed < 5
+
+
+def test_gives_up_after_max_retries():
+    with LLMStubServer(rate_limit_every=1, retry_after=0) as stub:
+        processor = AsyncLLMProcessor(api_key="test", base_url=stub.base_url, max_retries=2)
+        with pytest.raises(RateLimitError):
+            processor.process_document(*DOCUMENTS[0])
+
+    assert stub.requests == 3
+
+
+def test_backoff_without_retry_after_is_jittered():
+    processor = AsyncLLMProcessor(api_key="test", backoff_base=1.0, backoff_max=6.0)
+    error = SimpleNamespace(response=None)
+
+    delays = [processor._retry_delay(error, attempt=2) for _ in range(50)]
+    assert all(2.0 <= delay <= 4.0 for delay in delays)
+    assert len(set(delays)) > 1
+    assert all(processor._retry_delay(error, attempt=10) <= 6.0 for _ in range(10))
+
+
+def test_repeated_prompt_is_answered_from_the_cache(tmp_path):
+    with LLMStubServer() as stub:
+        processor = LLMProcessor(api_key="test", base_url=stub.base_url, cache=DiskCache(str(tmp_path)))
+        first = processor.process_document(*DOCUMENTS[0])
+        second = processor.process_document(*DOCUMENTS[0])
+        processor.process_document(*DOCUMENTS[1])
+
+    assert (first["cache_hit"], second["cache_hit"]) == (False, True)
+    assert second["data"] == first["data"]
+    assert stub.requests == 2
+    assert processor.cache_stats()["hits"] == 1
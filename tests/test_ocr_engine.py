@@ -0,0 +1,80 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+cv2 = pytest.importorskip("cv2")
+fitz = pytest.importorskip("fitz")
+
+from models import ocr_engine  # noqa: E402
+from models.ocr_engine import OCREngine, estimate_noise  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def clean_page():
+    """Born-digital text page rendered at 150 DPI, as BGR"""
+    document = fitz.open()
+    page = document.new_page(width=595, height=842)
+    y = 50
+    while y < 800:
+        page.insert_text((40, y), "The supplier shall deliver the goods according to 12345", fontsize=10)
+        y += 14
+    pixmap = page.get_pixmap(dpi=150, colorspace=fitz.csGRAY)
+    gray = np.frombuffer(pixmap.samples, dtype=np.uint8).reshape(pixmap.height, pixmap.width)
+    return cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR)
+
+
+def add_noise(image, sigma, seed=0):
+    noise = np.random.default_rng(seed).normal(0, sigma, image.shape)
+    return np.clip(image + noise, 0, 255).astype(np.uint8)
+
+
+def test_noise_estimate_ignores_text_edges(clean_page):
+    gray = cv2.cvtColor(clean_page, cv2.COLOR_BGR2GRAY)
+    assert estimate_noise(gray) < 0.5
+
+    estimates = [estimate_noise(cv2.cvtColor(add_noise(clean_page, sigma), cv2.COLOR_BGR2GRAY))
+                 for sigma in (4, 8, 16)]
+    assert estimates == sorted(estimates)
+    assert estimates[0] > 1.0
+
+
+def test_auto_profile_leaves_clean_pages_alone(clean_page):
+    engine = OCREngine()
+    assert engine.choose_profile(cv2.cvtColor(clean_page, cv2.COLOR_BGR2GRAY)) == "none"
+    assert engine.choose_profile(cv2.cvtColor(add_noise(clean_page, 16), cv2.COLOR_BGR2GRAY)) == "quality"
+
+
+def test_quality_profile_is_the_original_preprocessing(clean_page):
+    noisy = add_noise(clean_page, 8)
+    gray = cv2.cvtColor(noisy, cv2.COLOR_BGR2GRAY)
+    thresh = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2)
+    expected = cv2.cvtColor(cv2.fastNlMeansDenoising(thresh, None, 10, 7, 21), cv2.COLOR_GRAY2BGR)
+
+    assert np.array_equal(OCREngine().preprocess_image(noisy, "quality"), expected)
+
+
+def test_unknown_profile_is_rejected(clean_page):
+    engine = OCREngine()
+    with pytest.raises(ValueError, match="qualty"):
+        engine.preprocess_image(clean_page, "qualty")
+    with pytest.raises(ValueError):
+        engine.recognize(clean_page, preprocess="fats")
+    with pytest.raises(ValueError):
+        OCREngine(preprocess_profile="denoise")
+
+
+def test_pool_workers_get_the_preprocess_config(monkeypatch):
+    monkeypatch.setattr(OCREngine, "warmup", lambda self: None)
+    monkeypatch.setattr(ocr_engine, "_worker_engine", None)
+    engine = OCREngine(lang="kz", workers=2, preprocess_profile="fast", noise_thresholds=(1.0, 3.0))
+    created = {}
+
+    class Pool:
+        def __init__(self, **kwargs):
+            created.update(kwargs)
+
+    monkeypatch.setattr(ocr_engine, "ProcessPoolExecutor", Pool)
+    engine._get_pool()
+    created["initializer"](*created["initargs"])
+
+    worker = ocr_engine._worker_engine
+    assert (worker.lang, worker.preprocess_profile, worker.noise_thresholds) == ("kz", "fast", (1.0, 3.0))
@@ -0,0 +1,40 @@
+import pytest
+
+fitz = pytest.importorskip("fitz")
+pytest.importorskip("cv2")
+
+from utils.page_analysis import PageAnalyzer  # noqa: E402
+
+
+def scanned_page(fontsize):
+    """A4 page of text rasterized into an image, so it has no text layer"""
+    source = fitz.open()
+    page = source.new_page(width=595, height=842)
+    line = "The supplier shall deliver the goods according to the specification"
+    y = 60
+    while y < 780:
+        page.insert_text((40, y), line, fontsize=fontsize, fontname="helv")
+        y += fontsize * 1.5
+    pixmap = page.get_pixmap(dpi=200, colorspace=fitz.csGRAY)
+
+    scan = fitz.open()
+    scan.new_page(width=595, height=842).insert_image(page.rect, pixmap=pixmap)
+    return scan[0], scan
+
+
+def test_small_print_gets_more_dpi_than_large_print():
+    analyzer = PageAnalyzer()
+    small, small_doc = scanned_page(7)
+    large, large_doc = scanned_page(14)
+
+    small_dpi = analyzer.analyze(small)["dpi"]
+    large_dpi = analyzer.analyze(large)["dpi"]
+
+    assert small_dpi > 200
+    assert large_dpi == analyzer.min_dpi
+
+
+def test_blank_page_gets_min_dpi():
+    document = fitz.open()
+    page = document.new_page()
+    assert PageAnalyzer().analyze(page) == {"text_layer": False, "dpi": 150}
@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+fitz = pytest.importorskip("fitz")
+pytest.importorskip("cv2")
+
+from utils.pipeline import DocumentPipeline  # noqa: E402
+
+LINE = "The supplier shall deliver the goods according to the specification"
+
+
+class FakeOCREngine:
+    def __init__(self):
+        self.pages = 0
+
+    def recognize(self, image, preprocess=False):
+        self.pages += 1
+        return {
+            "results": [{"text": "scanned", "confidence": 0.9, "page": 0}],
+            "boxes": np.array([[[10, 10], [90, 10], [90, 30], [10, 30]]], dtype=np.float32),
+            "raw_text": "scanned",
+        }
+
+    def close(self):
+        pass
+
+
+class FakeDocumentProcessor:
+    def process_documents(self, images, ocr_results_list, batch_size=8):
+        return [{"document_type": 1, "fields": {}, "confidence": 0.5} for _ in images]
+
+
+class FakeLLMProcessor:
+    def __init__(self):
+        self.texts = []
+
+    def process_document(self, ocr_text, document_type, fields=None):
+        self.texts.append(ocr_text)
+        return {"success": True, "data": {"contract_number": "1"}}
+
+
+def write_pdf(path):
+    """Page 1 has a text layer, page 2 is the same text as a page-sized image"""
+    document = fitz.open()
+    page = document.new_page(width=595, height=842)
+    for y in range(60, 400, 20):
+        page.insert_text((40, y), LINE, fontsize=11, fontname="helv")
+    pixmap = page.get_pixmap(dpi=150, colorspace=fitz.csGRAY)
+    scan = document.new_page(width=595, height=842)
+    scan.insert_image(scan.rect, pixmap=pixmap)
+    document.save(path)
+
+
+def test_pdf_with_text_layer_and_scanned_page(tmp_path):
+    path = str(tmp_path / "contract.pdf")
+    write_pdf(path)
+    pipeline = DocumentPipeline()
+    pipeline._ocr_engine = FakeOCREngine()
+    pipeline._document_processor = FakeDocumentProcessor()
+    pipeline._llm_processor = FakeLLMProcessor()
+
+    result = pipeline.process(path, include_pages=True)
+
+    assert result["pages"] == 2
+    assert [page["source"] for page in result["page_results"]] == ["text_layer", "ocr"]
+    assert pipeline._ocr_engine.pages == 1
+    assert result["processing_times"]["text_layer_pages"] == 1
+    assert result["document_type"] == "contract"
+    assert "supplier" in pipeline._llm_processor.texts[0]
+    assert "scanned" in pipeline._llm_processor.texts[0]
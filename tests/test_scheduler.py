@@ -0,0 +1,17 @@
+import pytest
+
+from utils.scheduler import MicroBatcher
+
+
+def test_batches_items_in_order():
+    batcher = MicroBatcher(lambda items: [item * 2 for item in items], max_batch=4)
+    assert batcher.map([1, 2, 3]) == [2, 4, 6]
+    batcher.close()
+
+
+def test_submit_after_close_raises():
+    batcher = MicroBatcher(lambda items: items)
+    batcher.close()
+    with pytest.raises(RuntimeError):
+        batcher.submit(1)
+    batcher.close()  # a second close returns right away
@@ -0,0 +1,61 @@
+import pytest
+
+from utils.text_assembly import GAP_MARKER, TextAssembler, count_tokens
+
+
+def contract_page(number):
+    """Header, boilerplate paragraphs, a price table and a two-column signature block"""
+    words, boxes = [], []
+
+    def add(text, x0, y, x1):
+        words.append(text)
+        boxes.append((x0, y, x1, y + 20))
+
+    add(f"ДОГОВОР ПОСТАВКИ № {number}/24", 200, 40, 400)
+    add("г. Алматы", 50, 70, 120)
+    add("«5» марта 2024 г.", 450, 70, 560)
+    for paragraph in range(4):
+        for line in range(6):
+            add(f"Общие положения {paragraph}.{line} стороны руководствуются законодательством", 50,
+                120 + paragraph * 170 + line * 25, 550)
+    add("Наименование", 50, 820, 150)
+    add("Кол-во", 250, 820, 300)
+    add("Цена", 400, 820, 450)
+    add("Товар", 50, 845, 150)
+    add("10", 250, 845, 300)
+    add("1 000,00", 400, 845, 450)
+    for row, (left, right) in enumerate([("Поставщик:", "Покупатель:"), ("ТОО «А»", "ООО «Б»"),
+                                         ("БИН 123", "БИН 456"), ("Подпись ____", "Подпись ____")]):
+        add(left, 50, 900 + row * 25, 200)
+        add(right, 350, 900 + row * 25, 500)
+    return {"words": words, "boxes": boxes, "size": (595, 1100), "text": " ".join(words)}
+
+
+def test_reading_order_keeps_columns_and_table_rows():
+    text = TextAssembler().assemble([contract_page(1)])["text"]
+
+    assert "Наименование | Кол-во | Цена" in text
+    assert "Поставщик:\nТОО «А»\nБИН 123" in text
+    # The left column is read to its end before the right one starts
+    assert text.index("Подпись ____") < text.index("Покупатель:")
+
+
+@pytest.mark.parametrize("pages", [1, 3, 8])
+@pytest.mark.parametrize("budget", [60, 200, 500])
+def test_token_budget_covers_separators_and_markers(pages, budget):
+    assembly = TextAssembler(token_budget=budget).assemble([contract_page(i) for i in range(pages)])
+
+    assert assembly["document_tokens"] > budget
+    assert assembly["tokens"] == count_tokens(assembly["text"])
+    assert assembly["tokens"] <= budget
+    assert assembly["dropped_blocks"] > 0
+    # Pages without kept text get no separator, dropped runs one marker each
+    assert f"{GAP_MARKER}\n\n{GAP_MARKER}" not in assembly["text"]
+
+
+def test_budget_keeps_header_and_signature_first():
+    text = TextAssembler(token_budget=200).assemble([contract_page(i) for i in range(3)])["text"]
+
+    assert "ДОГОВОР ПОСТАВКИ № 0/24" in text
+    assert "БИН 456" in text
+    assert "Общие положения 0.0" not in text
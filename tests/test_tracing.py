@@ -0,0 +1,90 @@
+import time
+
+import pytest
+
+from utils.tracing import Tracer
+
+
+class FakeModel:
+    """PaddleX predictors return lazy generators"""
+
+    def __init__(self, output):
+        self.output = output
+        self.config = {"name": output}
+
+    def __call__(self, inputs, **kwargs):
+        for _ in inputs:
+            yield self.output
+
+
+class FakePipeline:
+    def __init__(self, **models):
+        vars(self).update(models)
+
+
+class FakeParallelWrapper:
+    """Like PaddleX's auto-parallel wrapper: attribute lookups fall through to the inner pipeline"""
+
+    def __init__(self, pipeline):
+        self._multi_device_inference = False
+        self._pipeline = pipeline
+
+    def __getattr__(self, name):
+        return getattr(self._pipeline, name)
+
+
+def fake_paddle_ocr():
+    preprocessor = FakeParallelWrapper(FakePipeline(doc_ori_classify_model=FakeModel("angle"),
+                                                    doc_unwarping_model=FakeModel("unwarped")))
+    pipeline = FakePipeline(doc_preprocessor_pipeline=preprocessor, text_det_model=FakeModel("polys"),
+                            textline_orientation_model=None, text_rec_model=FakeModel("text"))
+    return FakePipeline(paddlex_pipeline=FakeParallelWrapper(pipeline))
+
+
+def test_paddle_sub_models_get_their_own_spans():
+    ocr_engine = pytest.importorskip("models.ocr_engine")
+    tracer = Tracer(memory=False)
+    ocr = fake_paddle_ocr()
+
+    assert ocr_engine.trace_paddle_models(ocr, tracer) == ["ocr.detect", "ocr.orientation", "ocr.recognize",
+                                                           "ocr.unwarp"]
+    # Tracing twice does not nest the wrappers
+    assert ocr_engine.trace_paddle_models(ocr, tracer) == []
+
+    pipeline = ocr.paddlex_pipeline._pipeline
+    with tracer.span("ocr.predict", page=3):
+        assert pipeline.doc_preprocessor_pipeline.doc_unwarping_model([1, 2]) == ["unwarped", "unwarped"]
+        assert list(pipeline.text_det_model([1])) == ["polys"]
+        assert pipeline.text_rec_model.config == {"name": "text"}
+
+    records = {record["name"]: record for record in tracer.records()}
+    assert records["ocr.unwarp"]["parent"] == "ocr.predict"
+    assert records["ocr.unwarp"]["tags"] == {"page": 3, "items": 2}
+    assert records["ocr.detect"]["tags"]["items"] == 1
+
+
+def test_memory_is_reported_per_span():
+    tracer = Tracer(memory=True, memory_interval=0.005)
+    with tracer.span("allocate"):
+        block = b"x" * (64 << 20)
+    with tracer.span("transient"):
+        transient = b"x" * (64 << 20)
+        time.sleep(0.1)
+        del transient
+    with tracer.span("idle"):
+        pass
+    del block
+
+    records = {record["name"]: record for record in tracer.records()}
+    assert records["allocate"]["process_peak_rss_bytes"] > 0
+    assert records["allocate"]["rss_delta_bytes"] >= 32 << 20
+    assert records["allocate"]["peak_rss_delta_bytes"] >= records["allocate"]["rss_delta_bytes"]
+    # Freed before the span ended: only the sampled peak sees it
+    assert records["transient"]["peak_rss_delta_bytes"] >= 32 << 20
+    assert records["transient"]["rss_delta_bytes"] < 32 << 20
+    assert 0 <= records["idle"]["peak_rss_delta_bytes"] < 32 << 20
+
+    summary = tracer.summary()
+    assert summary["transient"]["peak_rss_delta_bytes"] == records["transient"]["peak_rss_delta_bytes"]
+    assert summary["transient"]["max_rss_bytes"] == records["transient"]["peak_rss_bytes"]
+    assert "docpipe_stage_peak_rss_delta_bytes" in tracer.prometheus_text()
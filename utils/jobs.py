@@ -0,0 +1,281 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.pipeline import ProcessingCancelled
+
+TERMINAL_STATUSES = ("done", "failed", "cancelled")
+
+logger = logging.getLogger(__name__)
+
+
+class DocumentJob:
+    def __init__(self, pipeline, image_path, on_event=None, filename=None, delete_file=False):
+        """
+        One document processed in the background, with progress events
+
+        Events are dictionaries with an 'event' key and a 'time' stamp:
+        'queued', 'started', 'opened' (pages), per page 'rendered', 'ocr_done'
+        (page text), 'layout_done', then 'llm_done' and one of 'done',
+        'failed' or 'cancelled'. They are delivered to listeners as they
+        happen and kept, so late subscribers replay them from the start.
+
+        Args:
+            pipeline: DocumentPipeline processing the document
+            image_path: Path to document image or PDF
+            on_event: Optional callable receiving every event, called from pipeline
+                threads; a listener that raises is logged and dropped
+            filename: Name shown to users, defaults to the file name of image_path
+            delete_file: Delete image_path once run() is done with it (uploaded temp files)
+        """
+        self.id = uuid.uuid4().hex
+        self.pipeline = pipeline
+        self.image_path = image_path
+        self.filename = filename or os.path.basename(image_path)
+        self.delete_file = delete_file
+        self.status = "queued"
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.pages_total = None
+        self.pages = {}
+
+        self._events = []
+        self._listeners = [on_event] if on_event is not None else []
+        self._stop = threading.Event()
+        self._condition = threading.Condition()
+        self._emit({"event": "queued"})
+
+    @property
+    def is_finished(self):
+        return self.status in TERMINAL_STATUSES
+
+    def run(self):
+        """Process the document in the calling thread; returns the final status"""
+        try:
+            with self._condition:
+                if self.is_finished:
+                    # Cancelled while queued
+                    return self.status
+                self.status = "running"
+                self.started = time.time()
+            self._emit({"event": "started"})
+
+            try:
+                result = self.pipeline.process(self.image_path, stop_event=self._stop, on_event=self._emit)
+                self._finish("done", {"event": "done"}, result=result)
+            except ProcessingCancelled:
+                self._finish("cancelled", {"event": "cancelled"})
+            except Exception as e:
+                self._finish("failed", {"event": "failed", "error": str(e)}, error=str(e))
+            return self.status
+        finally:
+            # Only the worker deletes the file, so it never disappears while being read
+            if self.delete_file and os.path.exists(self.image_path):
+                os.unlink(self.image_path)
+
+    def cancel(self):
+        """
+        Ask the job to stop
+
+        A queued job is cancelled right away; a running one stops before its
+        next page or before the LLM call, whichever comes first.
+        """
+        self._stop.set()
+        # _finish only moves a job that is still queued: checked and set under the lock
+        self._finish("cancelled", {"event": "cancelled"}, only_if="queued")
+
+    def wait(self, timeout=None):
+        """Block until the job is finished or timeout seconds passed; returns the status"""
+        with self._condition:
+            self._condition.wait_for(lambda: self.is_finished, timeout)
+            return self.status
+
+    def events(self, start=0, timeout=None):
+        """
+        Iterate over events, blocking until new ones arrive, up to the final one
+
+        Args:
+            start: Index of the first event, 0 replays everything
+            timeout: Seconds to wait for the next event before giving up
+        """
+        index = start
+        while True:
+            with self._condition:
+                if not self._condition.wait_for(lambda: len(self._events) > index, timeout):
+                    return
+                pending = self._events[index:]
+            for event in pending:
+                yield event
+                if event["event"] in TERMINAL_STATUSES:
+                    return
+            index += len(pending)
+
+    async def aevents(self, start=0):
+        """Async iterator over events, for event loops (e.g. a streaming HTTP response)"""
+        loop = asyncio.get_running_loop()
+        inbox = asyncio.Queue()
+
+        def deliver(event):
+            loop.call_soon_threadsafe(inbox.put_nowait, event)
+
+        with self._condition:
+            for event in self._events[start:]:
+                inbox.put_nowait(event)
+            self._listeners.append(deliver)
+        try:
+            while True:
+                event = await inbox.get()
+                yield event
+                if event["event"] in TERMINAL_STATUSES:
+                    return
+        finally:
+            with self._condition:
+                if deliver in self._listeners:
+                    self._listeners.remove(deliver)
+
+    def progress(self):
+        """Snapshot of the job: status, page counters and, when done, the result"""
+        with self._condition:
+            pages = [dict(self.pages[page], page=page) for page in sorted(self.pages)]
+            progress = {
+                "job_id": self.id,
+                "filename": self.filename,
+                "status": self.status,
+                "created": self.created,
+                "started": self.started,
+                "finished": self.finished,
+                "pages_total": self.pages_total,
+                "pages_rendered": len(pages),
+                "pages_ocr_done": sum(1 for page in pages if page.get("ocr_done")),
+                "pages_layout_done": sum(1 for page in pages if page.get("layout_done")),
+                "llm_done": any(event["event"] == "llm_done" for event in self._events),
+                "pages": pages
+            }
+        if self.result is not None:
+            progress["result"] = self.result
+        if self.error is not None:
+            progress["error"] = self.error
+        return progress
+
+    def _emit(self, event):
+        event = dict(event, time=time.time())
+        with self._condition:
+            self._track(event)
+            self._events.append(event)
+            listeners = list(self._listeners)
+            self._condition.notify_all()
+        for listener in listeners:
+            try:
+                listener(event)
+            except Exception:
+                # E.g. a streaming client went away and its event loop is closed
+                logger.exception("Dropping event listener of job %s", self.id)
+                with self._condition:
+                    if listener in self._listeners:
+                        self._listeners.remove(listener)
+
+    def _track(self, event):
+        kind = event["event"]
+        if kind == "opened":
+            self.pages_total = event["pages"]
+        elif kind == "rendered":
+            self.pages[event["page"]] = {"source": event["source"]}
+        elif kind == "ocr_done":
+            self.pages.setdefault(event["page"], {}).update(ocr_done=True, text=event["text"])
+        elif kind == "layout_done":
+            self.pages.setdefault(event["page"], {}).update(layout_done=True, document_type=event["document_type"])
+
+    def _finish(self, status, event, result=None, error=None, only_if=None):
+        with self._condition:
+            if self.is_finished or (only_if is not None and self.status != only_if):
+                return
+            self.status = status
+            self.result = result
+            self.error = error
+            self.finished = time.time()
+        self._emit(event)
+
+
+class JobManager:
+    def __init__(self, pipeline, workers=1, max_pending=None, keep_finished=1000):
+        """
+        Run DocumentJobs on a thread pool in front of one shared pipeline
+
+        Args:
+            pipeline: DocumentPipeline shared by every job
+            workers: Documents processed at once
+            max_pending: Jobs queued or running before submit() refuses new
+                ones, None for no limit
+            keep_finished: Finished jobs kept for lookup, oldest are dropped first
+        """
+        self.pipeline = pipeline
+        self.max_pending = max_pending
+        self.keep_finished = keep_finished
+        self.jobs = OrderedDict()
+        self._closed = False
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="document-job")
+
+    def submit(self, image_path, on_event=None, filename=None, delete_file=False):
+        """
+        Queue a document
+
+        Returns:
+            The DocumentJob, or None when max_pending jobs are already queued or running
+
+        Raises:
+            RuntimeError: The manager is closed
+        """
+        with self._lock:
+            # A job registered here but refused by the shut down executor would stay queued forever
+            if self._closed:
+                raise RuntimeError("JobManager is closed")
+            if self.max_pending is not None and self._pending() >= self.max_pending:
+                return None
+            job = DocumentJob(self.pipeline, image_path, on_event=on_event,
+                              filename=filename, delete_file=delete_file)
+            self.jobs[job.id] = job
+            self._trim()
+            self._executor.submit(job.run)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def cancel(self, job_id):
+        """Cancel a job by id; returns the job, or None if it is unknown"""
+        job = self.get(job_id)
+        if job is not None:
+            job.cancel()
+        return job
+
+    def pending(self):
+        with self._lock:
+            return self._pending()
+
+    def _pending(self):
+        return sum(1 for job in self.jobs.values() if not job.is_finished)
+
+    def _trim(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job.is_finished]
+        for job_id in finished[:max(0, len(finished) - self.keep_finished)]:
+            del self.jobs[job_id]
+
+    def close(self, cancel=False):
+        """Refuse new jobs and wait for running ones, or cancel every unfinished one first"""
+        with self._lock:
+            self._closed = True
+            jobs = list(self.jobs.values())
+        if cancel:
+            for job in jobs:
+                job.cancel()
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,167 @@
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Fields returned for every request, same shape as the real extraction output
+DEFAULT_RESPONSE = {
+    "contract_number": None,
+    "contract_date": None,
+    "contract_expiration_date": None,
+    "counterparty_name": None,
+    "counterparty_country": None,
+    "contract_sum": None,
+    "contract_sum_currency": None,
+    "contract_payment_currency": None
+}
+
+
+class LLMStubServer:
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, rate_limit_every=0,
+                 retry_after=0.0, response=None):
+        """
+        Local OpenAI-compatible chat completions server for offline runs
+
+        Args:
+            host: Interface to bind
+            port: Port to bind, 0 picks a free one
+            latency: Seconds to wait before answering, to mimic the real API
+            rate_limit_every: Answer every N-th request with HTTP 429, 0 disables it
+            retry_after: Value of the Retry-After header sent with 429 responses
+            response: JSON object returned as the assistant message
+        """
+        self.latency = latency
+        self.rate_limit_every = rate_limit_every
+        self.retry_after = retry_after
+        self.response = response if response is not None else DEFAULT_RESPONSE
+        self.requests = 0
+        self.rate_limited = 0
+        # Requests being answered right now, and the most there ever were at once
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+        self._thread = None
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        """Serve in a background thread and return self"""
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _next_request(self):
+        """Count a request and tell whether it should be rate limited"""
+        with self._lock:
+            self.requests += 1
+            limited = self.rate_limit_every > 0 and self.requests % self.rate_limit_every == 0
+            if limited:
+                self.rate_limited += 1
+            return limited
+
+    def _enter(self):
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+    def _leave(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                stub._enter()
+                try:
+                    self._answer()
+                finally:
+                    stub._leave()
+
+            def _answer(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+
+                if not self.path.endswith("/chat/completions"):
+                    self._send(404, {"error": {"message": f"Unknown path {self.path}"}})
+                    return
+
+                if stub._next_request():
+                    self._send(429, {"error": {"message": "Rate limit reached", "type": "rate_limit"}},
+                               {"Retry-After": str(stub.retry_after)})
+                    return
+
+                if stub.latency:
+                    time.sleep(stub.latency)
+
+                prompt_chars = sum(len(m.get("content", "")) for m in body.get("messages", []))
+                content = json.dumps(stub.response, ensure_ascii=False)
+                self._send(200, {
+                    "id": f"chatcmpl-stub-{stub.requests}",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": body.get("model", "stub"),
+                    "choices": [{
+                        "index": 0,
+                        "message": {"role": "assistant", "content": content},
+                        "finish_reason": "stop"
+                    }],
+                    # Rough token estimate, good enough for offline accounting
+                    "usage": {
+                        "prompt_tokens": prompt_chars // 4,
+                        "completion_tokens": len(content) // 4,
+                        "total_tokens": (prompt_chars + len(content)) // 4
+                    }
+                })
+
+            def _send(self, status, payload, headers=None):
+                data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local OpenAI-compatible stub server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds per response')
+    parser.add_argument('--rate-limit-every', type=int, default=0, help='Send 429 on every N-th request')
+    args = parser.parse_args()
+
+    server = LLMStubServer(args.host, args.port, latency=args.latency, rate_limit_every=args.rate_limit_every)
+    print(f"Serving stub LLM on {server.base_url} (set OPENAI_BASE_URL to use it)")
+    server.start()
+    try:
+        server._thread.join()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+import math
+import unicodedata
+
+import numpy as np
+
+# Resolution PyMuPDF uses when no DPI is given, PDF coordinates are in points at this scale
+PDF_DPI = 72
+
+
+class PageAnalyzer:
+    def __init__(self, use_text_layer=True, min_text_words=20, min_text_quality=0.9,
+                 layout_dpi=PDF_DPI, min_dpi=150, max_dpi=300, max_pixels=12_000_000,
+                 analysis_dpi=100, target_x_height=16):
+        """
+        Decide per PDF page whether to trust its text layer or to OCR it, and at which DPI
+
+        Args:
+            use_text_layer: Take words straight from trustworthy text layers instead of OCR
+            min_text_words: Minimum number of words for a text layer to be used
+            min_text_quality: Minimum share of ordinary characters (letters, digits,
+                punctuation) in the text layer; lower means broken font encodings
+            layout_dpi: Render DPI of text-layer pages, only LayoutLMv3 sees that image
+            min_dpi: Lowest render DPI for scanned pages (large print, blank pages)
+            max_dpi: Highest render DPI for scanned pages (small print)
+            max_pixels: Upper bound for the rendered page size in pixels
+            analysis_dpi: DPI of the grayscale preview the print size is measured on
+            target_x_height: Height in pixels the median character should have
+                in the rendered scan
+        """
+        self.use_text_layer = use_text_layer
+        self.min_text_words = min_text_words
+        self.min_text_quality = min_text_quality
+        self.layout_dpi = layout_dpi
+        self.min_dpi = min_dpi
+        self.max_dpi = max_dpi
+        self.max_pixels = max_pixels
+        self.analysis_dpi = analysis_dpi
+        self.target_x_height = target_x_height
+
+    def analyze(self, page):
+        """
+        Analyze a PyMuPDF page
+
+        Args:
+            page: fitz.Page
+
+        Returns:
+            Dictionary with 'text_layer' (bool), 'dpi' to render at and, for
+            text-layer pages, the PyMuPDF 'words'
+        """
+        if self.use_text_layer:
+            words = page.get_text("words")
+            if self._is_trustworthy(page, words):
+                return {"text_layer": True, "dpi": self.layout_dpi, "words": words}
+
+        return {"text_layer": False, "dpi": self.scan_dpi(page)}
+
+    def _is_trustworthy(self, page, words):
+        if len(words) < self.min_text_words:
+            return False
+
+        # A page-sized image under the text is a scan with an OCR layer of unknown quality
+        page_area = abs(page.rect)
+        for image in page.get_image_info():
+            if abs(page.rect & image["bbox"]) > 0.8 * page_area:
+                return False
+
+        chars = [c for word in words for c in word[4]]
+        ordinary = sum(1 for c in chars if unicodedata.category(c)[0] in "LNPS" and c != "\ufffd")
+        return ordinary / max(len(chars), 1) >= self.min_text_quality
+
+    def scan_dpi(self, page):
+        """
+        Pick a render DPI for a scanned page from the size of its print
+
+        The median character height is measured on a low-resolution preview
+        and the page is rendered so that it becomes target_x_height pixels:
+        small print gets more pixels per inch, large print fewer. The result
+        is kept within min_dpi and max_dpi and capped at max_pixels.
+        """
+        x_height = self.x_height_inches(page)
+        dpi = self.target_x_height / x_height if x_height else self.min_dpi
+        dpi = min(max(dpi, self.min_dpi), self.max_dpi)
+
+        width_in = page.rect.width / PDF_DPI
+        height_in = page.rect.height / PDF_DPI
+        dpi = min(dpi, math.sqrt(self.max_pixels / max(width_in * height_in, 1e-6)))
+        return int(round(dpi))
+
+    def x_height_inches(self, page):
+        """
+        Median height of character-sized ink blobs on the page, in inches
+
+        The preview is binarized with Otsu's threshold, so faint or thin print
+        still counts as ink. On the sample contracts (10-12 pt print) this is
+        7-9 pixels at 100 DPI.
+
+        Returns:
+            Height in inches, or None when the page has no character-like blobs
+        """
+        import cv2
+        import fitz  # PyMuPDF
+
+        preview = page.get_pixmap(dpi=self.analysis_dpi, colorspace=fitz.csGRAY, alpha=False)
+        if preview.width == 0 or preview.height == 0:
+            return None
+        gray = np.frombuffer(preview.samples_mv, dtype=np.uint8).reshape(preview.height, preview.stride)
+        gray = gray[:, :preview.width]
+        _, ink = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)
+
+        _, _, stats, _ = cv2.connectedComponentsWithStats(ink, connectivity=8)
+        widths, heights = stats[1:, cv2.CC_STAT_WIDTH], stats[1:, cv2.CC_STAT_HEIGHT]
+        # Drop specks, rules, table borders and pictures
+        characters = (heights >= 3) & (heights <= preview.height / 20) & (widths <= 4 * heights)
+        if np.count_nonzero(characters) < 20:
+            return None
+        return float(np.median(heights[characters])) / self.analysis_dpi
+
+
+def text_layer_results(words, dpi):
+    """
+    Build OCR-shaped results from PyMuPDF words, in the coordinates of a page rendered at dpi
+
+    Args:
+        words: Tuples from page.get_text("words")
+        dpi: DPI the page image is rendered at
+
+    Returns:
+        Dictionary with the same layout as OCREngine.recognize output
+    """
+    scale = dpi / PDF_DPI
+    rects = np.array([word[:4] for word in words], dtype=np.float32).reshape(-1, 4) * scale
+    x1, y1, x2, y2 = rects.T
+    boxes = np.stack([
+        np.stack([x1, y1], axis=1),
+        np.stack([x2, y1], axis=1),
+        np.stack([x2, y2], axis=1),
+        np.stack([x1, y2], axis=1)
+    ], axis=1)
+
+    results = [{'text': word[4], 'confidence': 1.0, 'page': 0} for word in words]
+    return {
+        'results': results,
+        'boxes': boxes,
+        'raw_text': ' '.join(r['text'] for r in results),
+        'source': 'text_layer'
+    }
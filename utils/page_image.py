@@ -0,0 +1,87 @@
+import cv2
+import numpy as np
+from PIL import Image
+
+# LayoutLMv3 resizes every page to this square input
+LAYOUT_IMAGE_SIZE = 224
+
+
+class PageImage:
+    def __init__(self, array, channel_order="BGR", owner=None):
+        """
+        One decoded page image shared by OCR and LayoutLMv3
+
+        The pixels are held once. OCR gets the full-resolution buffer in BGR
+        order, LayoutLMv3 gets a small RGB image made from it, so no other
+        full-size copies are created along the way.
+
+        Args:
+            array: uint8 array of shape (H, W, 3)
+            channel_order: 'BGR' or 'RGB', the channel order of array
+            owner: Object owning the memory behind array (e.g. a fitz.Pixmap),
+                kept alive as long as the array is used
+        """
+        self.array = array
+        self.channel_order = channel_order
+        self._owner = owner
+
+    @classmethod
+    def from_pixmap(cls, pix):
+        """
+        Wrap a PyMuPDF pixmap without copying its samples where possible
+
+        RGB pixmaps are viewed in place; grayscale and alpha pixmaps need one
+        conversion pass straight to BGR.
+        """
+        samples = np.frombuffer(pix.samples_mv, dtype=np.uint8).reshape(pix.h, pix.w, pix.n)
+        if pix.n == 1:
+            return cls(cv2.cvtColor(samples, cv2.COLOR_GRAY2BGR), "BGR")
+        if pix.n == 4:
+            return cls(cv2.cvtColor(samples, cv2.COLOR_RGBA2BGR), "BGR")
+        return cls(samples, "RGB", owner=pix)
+
+    @classmethod
+    def from_file(cls, image_path):
+        """Decode an image file once, in OpenCV's BGR order"""
+        img = cv2.imread(image_path)
+        if img is None:
+            raise ValueError(f"Image at {image_path} could not be loaded.")
+        return cls(img, "BGR")
+
+    @property
+    def size(self):
+        """(width, height) in pixels of the full-resolution page, like PIL's Image.size"""
+        return self.array.shape[1], self.array.shape[0]
+
+    def bgr(self):
+        """
+        Full-resolution page in BGR order, as OCREngine expects it
+
+        An RGB buffer is converted in place when it is writable. A read-only
+        buffer (e.g. pixmap memory) is converted once and the original released.
+        """
+        if self.channel_order == "RGB":
+            if self.array.flags.writeable:
+                cv2.cvtColor(self.array, cv2.COLOR_RGB2BGR, dst=self.array)
+            else:
+                self.array = cv2.cvtColor(self.array, cv2.COLOR_RGB2BGR)
+                self._owner = None
+            self.channel_order = "BGR"
+        return self.array
+
+    def layout_image(self, size=LAYOUT_IMAGE_SIZE):
+        """
+        Small RGB PIL image for LayoutLMv3
+
+        The page is downscaled first, so the color conversion and the PIL copy
+        only touch size x size pixels.
+        """
+        small = cv2.resize(self.array, (size, size), interpolation=cv2.INTER_AREA)
+        if self.channel_order == "BGR":
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2RGB)
+        return Image.fromarray(small)
+
+    def release(self):
+        """Drop the pixel buffer once every stage is done with the page"""
+        self.array = None
+        self._owner = None
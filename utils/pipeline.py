@@ -1,17 +1,34 @@
+import os
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import repeat
 
-import cv2
-import fitz  # PyMuPDF
-import numpy as np
-from PIL import Image
+# Heavy dependencies (PyMuPDF, OpenCV, PaddleOCR, torch/transformers, openai) are
+# imported on first use, so importing this module and building a pipeline is cheap.
+from utils.cache import DiskCache
+from utils.stages import Stage, run_stages
+from utils.text_assembly import TextAssembler
+from utils.tracing import NULL_TRACER
 
-from models.document_processor import DocumentProcessor
-from models.llm_processor import LLMProcessor
-from models.ocr_engine import OCREngine
+
+SUPPORTED_EXTENSIONS = ('.pdf', '.png', '.jpg', '.jpeg', '.tif', '.tiff', '.bmp')
+
+
+class ProcessingCancelled(Exception):
+    """Raised by DocumentPipeline.process when its stop_event is set before the document is done"""
+
+
+def _ignore_event(event):
+    pass
 
 
 class DocumentPipeline:
-    def __init__(self, lang='ru', llm_api_key=None):
+    def __init__(self, lang='ru', llm_api_key=None, vt_batch_size=8, queue_size=2, ocr_workers=0,
+                 layout_backend="torch", page_analyzer=None, preprocess="none", tracer=None,
+                 batch_wait=None, ocr_batch_size=4, text_assembly=True, llm_token_budget=None,
+                 ocr_cache_dir=None, ocr_cache_max_bytes=1024 * 1024 * 1024,
+                 llm_cache_dir=None, llm_cache_max_bytes=256 * 1024 * 1024, llm_cache_ttl=30 * 24 * 3600):
         """
         Initialize the full document processing pipeline
 
@@ -19,92 +36,191 @@ class DocumentPipeline:
             lang: Language for OCR
             use_gpu: Whether to use GPU
             llm_api_key: API key for OpenAI
-        """
-        self.ocr_engine = OCREngine(lang=lang)
-        self.document_processor = DocumentProcessor()
-        self.llm_processor = LLMProcessor(api_key=llm_api_key)
+            vt_batch_size: Number of PDF pages per LayoutLMv3 forward pass
+            queue_size: Number of pages buffered between pipeline stages
+            ocr_workers: Number of OCR worker processes for multi-page documents
+            layout_backend: LayoutLMv3 inference backend ('torch', 'torch-int8' or 'onnx')
+            page_analyzer: PageAnalyzer deciding text layer vs. OCR and render DPI per PDF page
+            preprocess: OCR preprocessing profile ('none', 'fast', 'quality' or 'auto')
+            tracer: utils.tracing.Tracer collecting per-page stage and model spans,
+                None disables tracing
+            batch_wait: Seconds a page waits for pages of other documents to share
+                its OCR and LayoutLMv3 batch; None batches only within a document
+            ocr_batch_size: Maximum number of pages per shared OCR batch
+            text_assembly: Rebuild reading order (lines, columns, table rows) from
+                the OCR boxes for the LLM; False sends the flat page texts
+            llm_token_budget: Trim the LLM text to about this many tokens, keeping
+                header, parties, sums and signature block; None sends everything
+            ocr_cache_dir: Directory of the persistent OCR result cache, None disables it
+            ocr_cache_max_bytes: Size limit of the OCR cache before LRU eviction
+            llm_cache_dir: Directory of the persistent LLM response cache, None disables it
+            llm_cache_max_bytes: Size limit of the LLM cache before LRU eviction
+            llm_cache_ttl: Seconds a cached LLM response stays valid
 
-    def process(self, image_path):
+
+        Models are not loaded here: each stage loads on first use, or all of
+        them at once through warmup().
         """
-        Process a document through the entire pipeline
+        self.lang = lang
+        self.llm_api_key = llm_api_key
+        self.ocr_workers = ocr_workers
+        self.layout_backend = layout_backend
+        self._page_analyzer = page_analyzer
+        self.preprocess = preprocess
+        self.tracer = tracer if tracer is not None else NULL_TRACER
+        self.ocr_cache = DiskCache(ocr_cache_dir, max_bytes=ocr_cache_max_bytes) if ocr_cache_dir else None
+        self.llm_cache = DiskCache(llm_cache_dir, max_bytes=llm_cache_max_bytes,
+                                   ttl=llm_cache_ttl) if llm_cache_dir else None
+        self.vt_batch_size = vt_batch_size
+        self.batch_wait = batch_wait
+        self.ocr_batch_size = ocr_batch_size
+        self.queue_size = queue_size
+        self.text_assembler = TextAssembler(token_budget=llm_token_budget) if text_assembly else None
 
-        Args:
-            image_path: Path to document image or PDF
+        self._ocr_engine = None
+        self._document_processor = None
+        self._llm_processor = None
+        self._ocr_batcher = None
+        self._layout_batcher = None
+        self._load_lock = threading.Lock()
+
+    @property
+    def ocr_engine(self):
+        if self._ocr_engine is None:
+            with self._load_lock:
+                if self._ocr_engine is None:
+                    from models.ocr_engine import OCREngine
+                    self._ocr_engine = OCREngine(lang=self.lang, workers=self.ocr_workers, cache=self.ocr_cache,
+                                                 tracer=self.tracer)
+        return self._ocr_engine
+
+    @property
+    def document_processor(self):
+        if self._document_processor is None:
+            with self._load_lock:
+                if self._document_processor is None:
+                    from models.document_processor import DocumentProcessor
+                    self._document_processor = DocumentProcessor(backend=self.layout_backend, tracer=self.tracer)
+        return self._document_processor
+
+    @property
+    def llm_processor(self):
+        if self._llm_processor is None:
+            with self._load_lock:
+                if self._llm_processor is None:
+                    from models.llm_processor import LLMProcessor
+                    self._llm_processor = LLMProcessor(api_key=self.llm_api_key, cache=self.llm_cache,
+                                                       tracer=self.tracer)
+        return self._llm_processor
+
+    @property
+    def ocr_batcher(self):
+        """MicroBatcher grouping OCR pages of all documents in flight, used when batch_wait is set"""
+        if self._ocr_batcher is None:
+            with self._load_lock:
+                if self._ocr_batcher is None:
+                    from utils.scheduler import MicroBatcher
+                    self._ocr_batcher = MicroBatcher(
+                        lambda images: self.ocr_engine.recognize_many(images, preprocess=self.preprocess),
+                        max_batch=self.ocr_batch_size, max_wait=self.batch_wait, name="ocr-batcher"
+                    )
+        return self._ocr_batcher
+
+    @property
+    def layout_batcher(self):
+        """MicroBatcher grouping LayoutLMv3 pages of all documents in flight, used when batch_wait is set"""
+        if self._layout_batcher is None:
+            with self._load_lock:
+                if self._layout_batcher is None:
+                    from utils.scheduler import MicroBatcher
+                    self._layout_batcher = MicroBatcher(
+                        lambda items: self.document_processor.process_documents(
+                            [image for image, _ in items],
+                            [ocr_results for _, ocr_results in items],
+                            batch_size=self.vt_batch_size
+                        ),
+                        max_batch=self.vt_batch_size, max_wait=self.batch_wait, name="layout-batcher"
+                    )
+        return self._layout_batcher
+
+    @property
+    def page_analyzer(self):
+        if self._page_analyzer is None:
+            from utils.page_analysis import PageAnalyzer
+            self._page_analyzer = PageAnalyzer()
+        return self._page_analyzer
+
+    def warmup(self):
+        """
+        Load every model now instead of on the first document
 
         Returns:
-            Processed document information as JSON
+            Seconds spent loading each stage
         """
-        start_time = time.time()
+        timings = {}
 
-        if image_path.lower().endswith('.pdf'):
-            results = []
-            with fitz.open(image_path) as doc:
-                for page_num in range(len(doc)):
-                    page = doc.load_page(page_num)
-                    pix = page.get_pixmap()
+        start = time.perf_counter()
+        with self.tracer.span("load.ocr"):
+            self.ocr_engine.warmup()
+        timings["ocr"] = time.perf_counter() - start
 
-                    if pix.n == 1:
-                        img_rgb = cv2.cvtColor(np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.h, pix.w, 1),
-                                               cv2.COLOR_GRAY2RGB)
-                    elif pix.n == 4:
-                        img_rgb = cv2.cvtColor(np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.h, pix.w, 4),
-                                               cv2.COLOR_RGBA2RGB)
-                    else:
-                        img_rgb = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.h, pix.w, 3)
+        # Accessing the stage properties builds the models
+        start = time.perf_counter()
+        with self.tracer.span("load.vision_transformer"):
+            _ = self.document_processor
+        timings["vision_transformer"] = time.perf_counter() - start
 
-                    img = cv2.cvtColor(img_rgb, cv2.COLOR_RGB2BGR)
-                    image_for_pil = Image.fromarray(img_rgb)
+        start = time.perf_counter()
+        with self.tracer.span("load.llm"):
+            _ = self.llm_processor
+        timings["llm"] = time.perf_counter() - start
 
-                    # Step 1: Run OCR
-                    ocr_start = time.time()
-                    ocr_results = self.ocr_engine.recognize(img)
-                    ocr_time = time.time() - ocr_start
+        return timings
 
-                    # Step 2: Process with Vision Transformer
-                    vt_start = time.time()
-                    document_analysis = self.document_processor.process_document(image_for_pil, ocr_results)
+    def process(self, image_path, stop_event=None, on_event=None, include_pages=False):
+        """
+        Process a document through the entire pipeline
 
-                    vt_time = time.time() - vt_start
+        Pages are streamed through rasterization, OCR and the Vision Transformer
+        as separate stages, so page N+1 is rendered and OCR'd while page N is
+        in LayoutLMv3.
 
-                    results.append({
-                        "page_num": page_num + 1,
-                        "ocr_results": ocr_results,
-                        "document_analysis": document_analysis,
-                        "processing_times": {
-                            "ocr": ocr_time,
-                            "vision_transformer": vt_time
-                        }
-                    })
-        else:
-            img = cv2.imread(image_path)
-            if img is None:
-                raise ValueError(f"Image at {image_path} could not be loaded.")
-            image_for_pil = Image.open(image_path).convert("RGB")
-
-            # Step 1: Run OCR
-            ocr_start = time.time()
-            ocr_results = self.ocr_engine.recognize(img)
-            ocr_time = time.time() - ocr_start
-
-            # Step 2: Process with Vision Transformer
-            vt_start = time.time()
-            document_analysis = self.document_processor.process_document(image_for_pil, ocr_results)
-            vt_time = time.time() - vt_start
-            results = [{
-                "page_num": 1,
-                "ocr_results": ocr_results,
-                "document_analysis": document_analysis,
-                "processing_times": {
-                    "ocr": ocr_time,
-                    "vision_transformer": vt_time
-                }
-            }]
+        Args:
+            image_path: Path to document image or PDF
+            stop_event: Optional threading.Event; setting it stops the document
+                between pages and before the LLM call
+            on_event: Optional callable receiving progress event dictionaries,
+                see iter_pages; 'llm_done' follows once the LLM has answered
+            include_pages: Add 'page_results' with the text, source and
+                LayoutLMv3 analysis of every page, e.g. for evaluation
+
+        Returns:
+            Processed document information as JSON
+
+        Raises:
+            ProcessingCancelled: stop_event was set before the document was done
+        """
+        start_time = time.perf_counter()
+        on_event = on_event or _ignore_event
+
+        # Only compact page records are kept, page images are released as pages finish
+        results = list(self.iter_pages(image_path, stop_event=stop_event, on_event=on_event))
+        if stop_event is not None and stop_event.is_set():
+            raise ProcessingCancelled(image_path)
+        if not results:
+            raise ValueError(f"Document at {image_path} has no pages.")
 
         # Step 3: Process with LLM
-        llm_start = time.time()
+        llm_start = time.perf_counter()
 
         # Combine text from all pages for the LLM
-        full_text = "\n".join([res['ocr_results']['raw_text'] for res in results])
+        if self.text_assembler is not None:
+            with self.tracer.span("text_assembly", document=os.path.basename(image_path)) as span:
+                assembly = self.text_assembler.assemble(results)
+                span.set(document_tokens=assembly["document_tokens"], llm_text_tokens=assembly["tokens"])
+            full_text = assembly["text"]
+        else:
+            full_text = "\n".join([res['text'] for res in results])
 
         # For simplicity, we'll use the analysis of the first page for document type and fields
         # A more advanced approach could involve a voting mechanism or other heuristics
@@ -112,32 +228,251 @@ class DocumentPipeline:
         document_type = first_page_analysis['document_type']
         fields = first_page_analysis['fields']
 
-        llm_results = self.llm_processor.process_document(
-            full_text,
-            document_type,
-            fields
-        )
-        llm_time = time.time() - llm_start
+        with self.tracer.span("llm", document=os.path.basename(image_path)):
+            llm_results = self.llm_processor.process_document(
+                full_text,
+                document_type,
+                fields
+            )
+        llm_time = time.perf_counter() - llm_start
+        on_event({"event": "llm_done", "success": bool(llm_results.get("success")),
+                  "cache_hit": bool(llm_results.get("cache_hit"))})
 
         # Combine results
+        total_rasterize_time = sum(res['processing_times']['rasterize'] for res in results)
         total_ocr_time = sum(res['processing_times']['ocr'] for res in results)
         total_vt_time = sum(res['processing_times']['vision_transformer'] for res in results)
+        ocr_cache_hits = sum(1 for res in results if res['cache_hit'])
+        text_layer_pages = sum(1 for res in results if res['source'] == 'text_layer')
 
         result = {
             "document_type": self._get_document_type_name(document_type),
             "extracted_data": llm_results.get("data", {}),
             "confidence": first_page_analysis['confidence'],  # Using first page confidence
             "processing_times": {
+                "rasterize": total_rasterize_time,
                 "ocr": total_ocr_time,
+                "ocr_cache_hits": ocr_cache_hits,
+                "text_layer_pages": text_layer_pages,
                 "vision_transformer": total_vt_time,
                 "llm": llm_time,
-                "total": time.time() - start_time
+                "llm_cache_hit": bool(llm_results.get("cache_hit")),
+                "total": time.perf_counter() - start_time
             },
             "pages": len(results)
         }
+        if self.text_assembler is not None:
+            result["llm_input"] = {key: assembly[key] for key in ("tokens", "document_tokens", "dropped_blocks")}
+        if include_pages:
+            result["page_results"] = [{
+                "page_num": res["page_num"],
+                "text": res["text"],
+                "source": res["source"],
+                "document_analysis": res["document_analysis"]
+            } for res in results]
 
         return result
 
+    def iter_pages(self, image_path, stop_event=None, on_event=None):
+        """
+        Stream a document page by page through rasterization, OCR and LayoutLMv3
+
+        At most a few pages are in flight between stages; each page image is
+        dropped as soon as LayoutLMv3 is done with it, so memory stays flat
+        however long the document is.
+
+        Args:
+            image_path: Path to document image or PDF
+            stop_event: Optional threading.Event that stops the stream when set
+            on_event: Optional callable receiving progress event dictionaries from
+                the pipeline threads: 'opened' (pages), then per page 'rendered',
+                'ocr_done' (with the page text) and 'layout_done'
+
+        Yields:
+            Compact page records in page order: page_num, text, words, boxes
+            (float32 (N, 4) pixel x1, y1, x2, y2), size, source, cache_hit,
+            document_analysis and processing_times
+        """
+        on_event = on_event or _ignore_event
+
+        def rendered_pages():
+            for page in self._iter_pages(image_path, on_event):
+                on_event({"event": "rendered", "page": page["page_num"],
+                          "source": "text_layer" if "ocr_results" in page else "ocr"})
+                yield page
+
+        def ocr_page(page):
+            page = self._ocr_page(page)
+            ocr_results = page["ocr_results"]
+            on_event({"event": "ocr_done", "page": page["page_num"], "text": ocr_results["raw_text"],
+                      "words": len(ocr_results["results"]), "cache_hit": bool(ocr_results.get("cache_hit"))})
+            return page
+
+        def analyze_pages(pages):
+            records = self._analyze_pages(pages)
+            for record in records:
+                analysis = record["document_analysis"]
+                on_event({"event": "layout_done", "page": record["page_num"],
+                          "document_type": self._get_document_type_name(analysis["document_type"]),
+                          "confidence": analysis["confidence"]})
+            return records
+
+        stages = [
+            # One feeding thread per OCR worker process keeps the whole pool busy
+            Stage("ocr", ocr_page, workers=max(1, self.ocr_workers),
+                  maxsize=max(self.queue_size, self.ocr_workers)),
+            Stage("vision_transformer", analyze_pages,
+                  batch_size=self.vt_batch_size, maxsize=self.queue_size),
+        ]
+        yield from run_stages(rendered_pages(), stages, stop_event=stop_event)
+
+    def _iter_pages(self, image_path, on_event=None):
+        """Yield pages of a PDF or image one by one, rendering them lazily"""
+        from utils.page_image import PageImage
+
+        document = os.path.basename(image_path)
+        if image_path.lower().endswith('.pdf'):
+            import fitz  # PyMuPDF
+            from utils.page_analysis import text_layer_results
+
+            with fitz.open(image_path) as doc:
+                if on_event is not None:
+                    on_event({"event": "opened", "pages": len(doc)})
+                for page_num in range(len(doc)):
+                    rasterize_start = time.perf_counter()
+                    with self.tracer.span("rasterize", document=document, page=page_num + 1) as span:
+                        page = doc.load_page(page_num)
+
+                        # Born-digital pages skip OCR, scans are rendered at a DPI fitting the page
+                        with self.tracer.span("rasterize.analyze"):
+                            page_info = self.page_analyzer.analyze(page)
+                        image = PageImage.from_pixmap(page.get_pixmap(dpi=page_info["dpi"]))
+                        span.set(dpi=page_info["dpi"], text_layer=page_info["text_layer"])
+
+                    rendered = {
+                        "document": document,
+                        "page_num": page_num + 1,
+                        "image": image,
+                        "dpi": page_info["dpi"],
+                        "processing_times": {
+                            "rasterize": time.perf_counter() - rasterize_start
+                        }
+                    }
+                    if page_info["text_layer"]:
+                        rendered["ocr_results"] = text_layer_results(page_info["words"], page_info["dpi"])
+                    yield rendered
+        else:
+            if on_event is not None:
+                on_event({"event": "opened", "pages": 1})
+            rasterize_start = time.perf_counter()
+            with self.tracer.span("rasterize", document=document, page=1):
+                image = PageImage.from_file(image_path)
+
+            yield {
+                "document": document,
+                "page_num": 1,
+                "image": image,
+                "processing_times": {
+                    "rasterize": time.perf_counter() - rasterize_start
+                }
+            }
+
+    def _ocr_page(self, page):
+        """Pipeline stage: run OCR on one rendered page"""
+        if "ocr_results" in page:
+            # Words already came from the PDF text layer
+            page["processing_times"]["ocr"] = 0.0
+            return page
+
+        ocr_start = time.perf_counter()
+        with self.tracer.span("ocr", document=page["document"], page=page["page_num"]) as span:
+            if self.batch_wait is not None:
+                page["ocr_results"] = self.ocr_batcher(page["image"].bgr())
+            else:
+                page["ocr_results"] = self.ocr_engine.recognize(page["image"].bgr(), preprocess=self.preprocess)
+            span.set(words=len(page["ocr_results"]["results"]))
+        page["processing_times"]["ocr"] = time.perf_counter() - ocr_start
+        return page
+
+    def _analyze_pages(self, pages):
+        """Pipeline stage: run LayoutLMv3 on whichever pages are ready, in one batch"""
+        vt_start = time.perf_counter()
+        with self.tracer.span("vision_transformer", document=pages[0]["document"],
+                              pages=[page["page_num"] for page in pages]):
+            if self.batch_wait is not None:
+                # Pages of other documents in flight join the same forward pass
+                analyses = self.layout_batcher.map([(page["image"], page["ocr_results"]) for page in pages])
+            else:
+                analyses = self.document_processor.process_documents(
+                    [page["image"] for page in pages],
+                    [page["ocr_results"] for page in pages],
+                    batch_size=self.vt_batch_size
+                )
+        vt_time = time.perf_counter() - vt_start
+
+        records = []
+        for page, document_analysis in zip(pages, analyses):
+            # Batched time is shared evenly so per-page totals still add up
+            page["processing_times"]["vision_transformer"] = vt_time / len(pages)
+            page["document_analysis"] = document_analysis
+            records.append(self._compact_page(page))
+        return records
+
+    def _compact_page(self, page):
+        """Keep only what later steps need from a page; images and polygons are dropped"""
+        import numpy as np
+
+        ocr_results = page["ocr_results"]
+        polys = np.asarray(ocr_results["boxes"], dtype=np.float32).reshape(-1, 4, 2)
+        width, height = page["image"].size
+        page["image"].release()
+
+        return {
+            "page_num": page["page_num"],
+            "text": ocr_results["raw_text"],
+            "words": [item["text"] for item in ocr_results["results"]],
+            "boxes": np.concatenate([polys.min(axis=1), polys.max(axis=1)], axis=1),
+            "size": (width, height),
+            "source": ocr_results.get("source", "ocr"),
+            "cache_hit": bool(ocr_results.get("cache_hit")),
+            "document_analysis": page["document_analysis"],
+            "processing_times": page["processing_times"]
+        }
+
+    def process_many(self, image_paths, workers=1, include_pages=False):
+        """
+        Process many documents with the models already loaded by this pipeline
+
+        With workers > 1 several documents are in flight at once, so the LLM
+        call of one document overlaps with OCR and LayoutLMv3 of the next.
+
+        Args:
+            image_paths: Iterable of paths to document images or PDFs
+            workers: Number of documents processed concurrently
+            include_pages: Passed on to process()
+
+        Yields:
+            (image_path, result, error) tuples in input order; error is the
+            exception raised for that document, or None on success
+        """
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            yield from executor.map(self._process_safely, image_paths, repeat(include_pages))
+
+    def _process_safely(self, image_path, include_pages=False):
+        try:
+            return image_path, self.process(image_path, include_pages=include_pages), None
+        except Exception as e:
+            return image_path, None, e
+
+    def close(self):
+        """Release batching threads and worker processes held by the pipeline"""
+        for batcher in (self._ocr_batcher, self._layout_batcher):
+            if batcher is not None:
+                batcher.close()
+        self._ocr_batcher = self._layout_batcher = None
+        if self._ocr_engine is not None:
+            self._ocr_engine.close()
+
     def _get_document_type_name(self, type_id):
         types = {
             0: "receipt",
@@ -0,0 +1,106 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+_CLOSE = object()
+
+
+class MicroBatcher:
+    def __init__(self, fn, max_batch=8, max_wait=0.01, name="batcher"):
+        """
+        Collect single items from many threads and run them through fn in batches
+
+        The first item of a batch waits at most max_wait seconds for others to
+        join, so a lone request pays a small fixed delay while concurrent
+        requests share one call of fn.
+
+        Args:
+            fn: Function taking a list of items and returning a list of results
+                in the same order
+            max_batch: Maximum number of items per call of fn
+            max_wait: Seconds the first item of a batch waits for more items
+            name: Name of the batching thread
+        """
+        self.fn = fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.batches = 0
+        self.items = 0
+        self._queue = queue.Queue()
+        self._closed = False
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, item):
+        """Queue one item and return a Future resolving to its result; raises RuntimeError once closed"""
+        future = Future()
+        with self._lock:
+            # Nothing may follow the close marker, no worker would ever take it
+            if self._closed:
+                raise RuntimeError("MicroBatcher is closed")
+            self._queue.put((item, future))
+        return future
+
+    def __call__(self, item):
+        """Run one item through the next batch and wait for its result"""
+        return self.submit(item).result()
+
+    def map(self, items):
+        """Submit several items at once and wait for all results, in order"""
+        futures = [self.submit(item) for item in items]
+        return [future.result() for future in futures]
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "mean_batch_size": self.items / self.batches if self.batches else 0.0
+        }
+
+    def close(self):
+        """Finish queued items and stop the batching thread"""
+        with self._lock:
+            if not self._closed:
+                self._closed = True
+                self._queue.put(_CLOSE)
+        self._thread.join()
+
+    def _run(self):
+        closing = False
+        while not closing:
+            entry = self._queue.get()
+            if entry is _CLOSE:
+                return
+            batch = [entry]
+
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                try:
+                    entry = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if entry is _CLOSE:
+                    closing = True
+                    break
+                batch.append(entry)
+
+            self._run_batch(batch)
+
+    def _run_batch(self, batch):
+        items = [item for item, _ in batch]
+        futures = [future for _, future in batch]
+        try:
+            results = self.fn(items)
+        except Exception as e:
+            # Every caller of the failed batch sees the error
+            for future in futures:
+                future.set_exception(e)
+            return
+
+        self.batches += 1
+        self.items += len(items)
+        for future, result in zip(futures, results):
+            future.set_result(result)
@@ -0,0 +1,173 @@
+import queue
+import threading
+
+_DONE = object()
+
+
+class Stage:
+    def __init__(self, name, fn, workers=1, batch_size=1, maxsize=2):
+        """
+        One step of a streaming page pipeline
+
+        Args:
+            name: Stage name, used for thread names
+            fn: Callable applied to one item, or to a list of items when batch_size > 1
+            workers: Number of threads running this stage
+            batch_size: Maximum number of already queued items handed to fn at once
+            maxsize: Capacity of the bounded input queue of this stage
+        """
+        self.name = name
+        self.fn = fn
+        self.workers = workers
+        self.batch_size = batch_size
+        self.maxsize = maxsize
+
+
+class _StageError:
+    def __init__(self, exc):
+        self.exc = exc
+
+
+def run_stages(source, stages, stop_event=None):
+    """
+    Stream items from source through stages connected by bounded queues
+
+    Every stage runs in its own thread(s), so item N+1 can be in an earlier
+    stage while item N is still in a later one. Queues are bounded, so a slow
+    stage applies backpressure instead of letting items pile up in memory.
+
+    Args:
+        source: Iterable producing the input items, consumed in a producer thread
+        stages: List of Stage objects applied in order
+        stop_event: Optional threading.Event that aborts the run when set
+
+    Yields:
+        Items that passed through all stages, in source order
+
+    Raises:
+        The first exception raised by the source or any stage
+    """
+    if not stages:
+        raise ValueError("run_stages needs at least one stage")
+
+    # Internal stop flag, so a finished run never sets the caller's event
+    stop = threading.Event()
+
+    def stopped():
+        return stop.is_set() or (stop_event is not None and stop_event.is_set())
+
+    queues = [queue.Queue(maxsize=stage.maxsize) for stage in stages]
+    output = queue.Queue()
+    threads = []
+
+    def put(target, item):
+        while not stopped():
+            try:
+                target.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def fail(exc):
+        stop.set()
+        output.put(_StageError(exc))
+
+    def produce():
+        try:
+            for index, item in enumerate(source):
+                if not put(queues[0], (index, item)):
+                    return
+        except Exception as exc:
+            fail(exc)
+            return
+        for _ in range(stages[0].workers):
+            put(queues[0], _DONE)
+
+    def work(position, remaining):
+        stage = stages[position]
+        inbox = queues[position]
+        is_last = position == len(stages) - 1
+        outbox = output if is_last else queues[position + 1]
+        downstream_workers = 1 if is_last else stages[position + 1].workers
+
+        while not stopped():
+            try:
+                first = inbox.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if first is _DONE:
+                break
+
+            batch = [first]
+            while len(batch) < stage.batch_size:
+                try:
+                    item = inbox.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _DONE:
+                    # Hand the sentinel back so this worker stops after the batch
+                    put(inbox, _DONE)
+                    break
+                batch.append(item)
+
+            try:
+                if stage.batch_size > 1:
+                    results = stage.fn([item for _, item in batch])
+                else:
+                    results = [stage.fn(batch[0][1])]
+            except Exception as exc:
+                fail(exc)
+                return
+
+            for (index, _), result in zip(batch, results):
+                if not put(outbox, (index, result)):
+                    return
+
+        # The last worker of a stage to finish signals the next stage
+        with remaining["lock"]:
+            remaining["count"] -= 1
+            last_worker = remaining["count"] == 0
+        if last_worker:
+            for _ in range(downstream_workers):
+                put(outbox, _DONE)
+
+    threads.append(threading.Thread(target=produce, name="stage-source", daemon=True))
+    for position, stage in enumerate(stages):
+        remaining = {"count": stage.workers, "lock": threading.Lock()}
+        for worker in range(stage.workers):
+            threads.append(threading.Thread(
+                target=work,
+                args=(position, remaining),
+                name=f"stage-{stage.name}-{worker}",
+                daemon=True
+            ))
+
+    for thread in threads:
+        thread.start()
+
+    # Re-order results, workers and batches may finish out of order
+    pending = {}
+    next_index = 0
+    try:
+        while True:
+            try:
+                item = output.get(timeout=0.1)
+            except queue.Empty:
+                if stopped() and output.empty():
+                    return
+                continue
+            if isinstance(item, _StageError):
+                # Surface the original exception so callers keep their error handling
+                raise item.exc
+            if item is _DONE:
+                break
+            index, result = item
+            pending[index] = result
+            while next_index in pending:
+                yield pending.pop(next_index)
+                next_index += 1
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join(timeout=1)
@@ -0,0 +1,292 @@
+import re
+
+try:
+    import tiktoken
+except ImportError:  # token counts are then estimated from the text length
+    tiktoken = None
+
+# Text patterns of the regions that hold the extraction targets
+REGION_PATTERNS = {
+    "number": re.compile(r"№|\bN\s?\d|номер", re.I),
+    "parties": re.compile(r"именуем|в лице|действующ|\b(?:ТОО|ООО|АО|ПАО|ЗАО|ИП|LLP|LLC|Ltd|GmbH|Inc)\b"
+                          r"|покупател|поставщик|продав|заказчик|исполнител|подрядчик|арендат|арендодат", re.I),
+    "sums": re.compile(r"сумм|цен[аы]|стоимост|валют|\b(?:KZT|RUB|USD|EUR|CNY|тенге|руб|долл|евро)"
+                       r"|\d[\d\s]*[.,]\d{2}\b", re.I),
+    "dates": re.compile(r"срок|действ\w* до|\b\d{1,2}[./]\d{1,2}[./]\d{2,4}\b|«\s*\d{1,2}\s*»|\b(?:19|20)\d{2}\s*г",
+                        re.I),
+    "signature": re.compile(r"подпис|реквизит|адрес|\b(?:БИН|ИИН|ИНН|КПП|БИК|IBAN|SWIFT|BIC)\b|р/с|банк|М\.П\.",
+                            re.I),
+}
+
+# Marker put where trimmed blocks were dropped from the text
+GAP_MARKER = "[...]"
+
+_encodings = {}
+
+
+def count_tokens(text, model="gpt-4o"):
+    """
+    Number of tokens text takes in a prompt of model
+
+    Uses tiktoken when it is installed; otherwise estimates about three
+    characters per token, which is close for mostly Cyrillic text.
+    """
+    if not text:
+        return 0
+    if tiktoken is None:
+        return len(text) // 3 + 1
+    if model not in _encodings:
+        try:
+            _encodings[model] = tiktoken.encoding_for_model(model)
+        except KeyError:
+            _encodings[model] = tiktoken.get_encoding("o200k_base")
+    return len(_encodings[model].encode(text))
+
+
+def build_lines(words, boxes, line_overlap=0.5):
+    """
+    Group word or OCR line boxes into text lines, top to bottom
+
+    Args:
+        words: Texts of the boxes
+        boxes: (x0, y0, x1, y1) per text, in page pixels
+        line_overlap: Share of the smaller height two boxes must overlap
+            vertically to sit on the same line
+
+    Returns:
+        List of lines as dictionaries with 'top', 'bottom' and 'items', a
+        left to right list of (x0, x1, text)
+    """
+    items = sorted(((box, text) for text, box in zip(words, boxes) if text.strip()),
+                   key=lambda item: (item[0][1] + item[0][3]) / 2)
+    lines = []
+    for (x0, y0, x1, y1), text in items:
+        line = lines[-1] if lines else None
+        if line is not None:
+            overlap = min(line["bottom"], y1) - max(line["top"], y0)
+            if overlap >= line_overlap * min(line["bottom"] - line["top"], y1 - y0):
+                line["items"].append((x0, x1, text))
+                line["top"], line["bottom"] = min(line["top"], y0), max(line["bottom"], y1)
+                continue
+        lines.append({"top": y0, "bottom": y1, "items": [(x0, x1, text)]})
+
+    for line in lines:
+        line["items"].sort()
+    return lines
+
+
+def split_cells(line, gap):
+    """Split a line into cells wherever the horizontal gap between boxes exceeds gap pixels"""
+    cells = []
+    for x0, x1, text in line["items"]:
+        if cells and x0 - cells[-1]["x1"] <= gap:
+            cells[-1]["x1"] = max(cells[-1]["x1"], x1)
+            cells[-1]["text"] += " " + text
+        else:
+            cells.append({"x0": x0, "x1": x1, "text": text})
+    return cells
+
+
+class TextAssembler:
+    def __init__(self, token_budget=None, model="gpt-4o", cell_gap=1.5, paragraph_gap=1.0,
+                 min_column_lines=3, max_block_lines=8, header_fraction=0.2):
+        """
+        Rebuild the reading order of OCR output and optionally trim it to a token budget
+
+        Boxes are grouped into lines; lines whose boxes are far apart are split
+        into cells. Runs of two-cell lines sharing a gutter near the page middle
+        are read as two columns, one after the other; lines of three or more
+        cells are table rows with ' | ' between the cells. The result is split
+        into blocks at paragraph gaps and region changes.
+
+        With a token budget, blocks are kept by priority: the header of the
+        first page and the closing signature block first, then blocks that
+        mention parties, numbers, sums or dates, then the rest in reading
+        order while the budget lasts.
+
+        Args:
+            token_budget: Maximum prompt tokens of the assembled text, None keeps everything
+            model: LLM model the tokens are counted for
+            cell_gap: Horizontal gap, in line heights, that starts a new cell
+            paragraph_gap: Vertical gap, in line heights, that starts a new block
+            min_column_lines: Two-cell lines needed in a row to read them as columns
+            max_block_lines: Longer blocks are split, so trimming can keep part of them
+            header_fraction: Top share of the first page that is its header
+        """
+        self.token_budget = token_budget
+        self.model = model
+        self.cell_gap = cell_gap
+        self.paragraph_gap = paragraph_gap
+        self.min_column_lines = min_column_lines
+        self.max_block_lines = max_block_lines
+        self.header_fraction = header_fraction
+
+    def page_blocks(self, page):
+        """
+        Blocks of one compact page record, in reading order
+
+        Args:
+            page: Dictionary with 'words', 'boxes' (N x 4 array), 'size' and 'text'
+
+        Returns:
+            List of blocks: dictionaries with 'kind' ('text', 'column' or
+            'table'), 'lines' (strings) and 'top' (page pixels)
+        """
+        words, boxes = page.get("words"), page.get("boxes")
+        if not words or boxes is None or len(boxes) != len(words):
+            # Nothing to order by, keep the flat text
+            return [{"kind": "text", "lines": [page["text"]], "top": 0}] if page.get("text") else []
+
+        lines = build_lines(words, boxes.tolist() if hasattr(boxes, "tolist") else boxes)
+        if not lines:
+            return []
+        heights = sorted(line["bottom"] - line["top"] for line in lines)
+        line_height = max(heights[len(heights) // 2], 1.0)
+        for line in lines:
+            line["cells"] = split_cells(line, self.cell_gap * line_height)
+
+        blocks = []
+        index = 0
+        while index < len(lines):
+            end = self._column_run(lines, index, page["size"][0])
+            if end > index:
+                blocks += self._column_blocks(lines[index:end])
+                index = end
+                continue
+
+            line = lines[index]
+            kind = "table" if len(line["cells"]) > 1 else "text"
+            text = " | ".join(cell["text"] for cell in line["cells"])
+            previous = blocks[-1] if blocks else None
+            if (previous is not None and previous["kind"] == kind and "bottom" in previous
+                    and line["top"] - previous["bottom"] <= self.paragraph_gap * line_height):
+                previous["lines"].append(text)
+                previous["bottom"] = line["bottom"]
+            else:
+                blocks.append({"kind": kind, "lines": [text], "top": line["top"], "bottom": line["bottom"]})
+            index += 1
+
+        return [dict(block, lines=block["lines"][start:start + self.max_block_lines])
+                for block in blocks
+                for start in range(0, len(block["lines"]), self.max_block_lines)]
+
+    def _column_run(self, lines, start, page_width):
+        """End index of a two-column run starting at lines[start], or start if there is none"""
+        gutter = None
+        two_cell_lines = 0
+        end = start
+        for line in lines[start:]:
+            cells = line["cells"]
+            if len(cells) == 2:
+                # The gutter is the gap both columns leave free on every line so far
+                left, right = cells[0]["x1"], cells[1]["x0"]
+                if gutter is not None:
+                    left, right = max(left, gutter[0]), min(right, gutter[1])
+                if left >= right:
+                    break
+                gutter = (left, right)
+                two_cell_lines += 1
+            elif len(cells) == 1 and gutter is not None and (cells[0]["x1"] <= gutter[0] or
+                                                             cells[0]["x0"] >= gutter[1]):
+                pass  # a line of only one of the columns
+            else:
+                break
+            end += 1
+
+        # Gutters away from the page middle are label / value forms, not columns
+        middle = gutter is not None and 0.35 * page_width <= (gutter[0] + gutter[1]) / 2 <= 0.65 * page_width
+        return end if two_cell_lines >= self.min_column_lines and middle else start
+
+    def _column_blocks(self, lines):
+        gutter = min(line["cells"][1]["x0"] for line in lines if len(line["cells"]) == 2)
+        columns = ([], [])
+        for line in lines:
+            for cell in line["cells"]:
+                columns[cell["x0"] >= gutter].append(cell["text"])
+        return [{"kind": "column", "lines": column, "top": lines[0]["top"]} for column in columns if column]
+
+    def assemble(self, pages):
+        """
+        Assemble the text of a document for the LLM
+
+        Args:
+            pages: Compact page records in page order
+
+        Returns:
+            Dictionary with 'text', its 'tokens', the 'document_tokens' of the
+            untrimmed text, and the number of 'blocks' and 'dropped_blocks'
+        """
+        blocks = []
+        for page_index, page in enumerate(pages):
+            page_height = page["size"][1] if page.get("size") else 0
+            page_blocks = self.page_blocks(page)
+            for position, block in enumerate(page_blocks):
+                text = "\n".join(block["lines"])
+                regions = {name for name, pattern in REGION_PATTERNS.items() if pattern.search(text)}
+                if page_index == 0 and block["top"] <= self.header_fraction * page_height:
+                    regions.add("header")
+                if page_index == len(pages) - 1 and position >= len(page_blocks) - 2:
+                    regions.add("signature")
+                blocks.append({"page": page_index, "text": text, "regions": regions,
+                               "tokens": count_tokens(text, self.model)})
+
+        document_text = self._join(blocks, [True] * len(blocks))
+        document_tokens = count_tokens(document_text, self.model)
+        keep = [True] * len(blocks)
+        if self.token_budget is not None and document_tokens > self.token_budget:
+            keep = self._select(blocks)
+
+        text = self._join(blocks, keep) if not all(keep) else document_text
+        return {
+            "text": text,
+            "tokens": count_tokens(text, self.model) if not all(keep) else document_tokens,
+            "document_tokens": document_tokens,
+            "blocks": len(blocks),
+            "dropped_blocks": keep.count(False)
+        }
+
+    def _select(self, blocks):
+        """Pick the blocks to keep within the token budget, by region priority"""
+        def priority(index):
+            regions = blocks[index]["regions"]
+            return (not ({"header", "signature"} & regions), -len(regions), index)
+
+        order = sorted(range(len(blocks)), key=priority)
+        # Besides its own tokens a kept block can bring a paragraph break and a gap
+        # marker before it, and the first kept block of a page the page separator
+        gap_cost = count_tokens(f"\n\n{GAP_MARKER}\n\n", self.model)
+        page_cost = count_tokens(f"--- page {blocks[-1]['page'] + 1} ---\n\n", self.model)
+
+        keep = [False] * len(blocks)
+        pages = set()
+        budget = self.token_budget
+        for index in order:
+            cost = blocks[index]["tokens"] + gap_cost + (page_cost if blocks[index]["page"] not in pages else 0)
+            if cost <= budget:
+                keep[index] = True
+                pages.add(blocks[index]["page"])
+                budget -= cost
+
+        # Tokens of the joined text are not exactly the sum of the parts, check the real thing
+        for index in reversed(order):
+            if not keep[index]:
+                continue
+            if count_tokens(self._join(blocks, keep), self.model) <= self.token_budget:
+                break
+            keep[index] = False
+        return keep
+
+    def _join(self, blocks, keep):
+        """Kept blocks in reading order, '[...]' per dropped run and a separator per page with kept text"""
+        parts = []
+        page = 0
+        for block, kept in zip(blocks, keep):
+            if not kept:
+                if not parts or parts[-1] != GAP_MARKER:
+                    parts.append(GAP_MARKER)
+                continue
+            if block["page"] != page:
+                parts.append(f"--- page {block['page'] + 1} ---")
+                page = block["page"]
+            parts.append(block["text"])
+        return "\n\n".join(parts)
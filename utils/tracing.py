@@ -0,0 +1,337 @@
+import contextvars
+import json
+import os
+import threading
+import time
+from collections import deque
+
+try:
+    import psutil
+except ImportError:  # RSS is then read from /proc or getrusage
+    psutil = None
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Tags of the innermost open span in the current thread or asyncio task, inherited by child spans
+_current = contextvars.ContextVar("trace_span", default=None)
+
+
+def current_rss():
+    """Resident set size of this process in bytes, 0 when it cannot be read"""
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return 0
+
+
+def peak_rss():
+    """Highest resident set size this process has reached, in bytes"""
+    if resource is None:
+        return current_rss()
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if os.uname().sysname == "Darwin" else peak * 1024
+
+
+def percentile(values, q):
+    """Linear-interpolated percentile of a list of numbers, q in [0, 100]"""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    position = (len(values) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+class RssSampler:
+    def __init__(self, interval=0.01):
+        """
+        Poll the process RSS in a background thread while spans are open
+
+        Each open span keeps the highest RSS sampled during its lifetime, so
+        short-lived allocations that are freed before the span ends still show
+        up in its peak. The thread idles while no span is open.
+
+        Args:
+            interval: Seconds between samples
+        """
+        self.interval = interval
+        self._open = set()
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def track(self, span):
+        with self._condition:
+            self._open.add(span)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="rss-sampler", daemon=True)
+                self._thread.start()
+            self._condition.notify()
+
+    def untrack(self, span):
+        with self._condition:
+            self._open.discard(span)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._open)
+            rss = current_rss()
+            with self._condition:
+                for span in self._open:
+                    span.rss_peak = max(span.rss_peak, rss)
+            time.sleep(self.interval)
+
+
+class Span:
+    __slots__ = ("tracer", "name", "tags", "parent", "start", "duration", "rss_start", "rss_peak", "_token")
+
+    def __init__(self, tracer, name, tags):
+        self.tracer = tracer
+        self.name = name
+        self.tags = tags
+        self.parent = None
+        self.start = 0
+        self.duration = 0.0
+        self.rss_start = 0
+        self.rss_peak = 0
+        self._token = None
+
+    def set(self, **tags):
+        """Attach tags known only once the work is done, e.g. token counts"""
+        self.tags.update(tags)
+
+    def __enter__(self):
+        parent = _current.get()
+        if parent is not None:
+            # Page and document tags flow down into spans opened by the models
+            self.parent = parent.name
+            self.tags = {**parent.tags, **self.tags}
+        self._token = _current.set(self)
+        if self.tracer.memory:
+            self.rss_start = self.rss_peak = current_rss()
+            self.tracer._sampler.track(self)
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration = (time.perf_counter_ns() - self.start) / 1e9
+        _current.reset(self._token)
+        if self.tracer.memory:
+            self.tracer._sampler.untrack(self)
+        self.tracer._finish(self, exc_type)
+        return False
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def set(self, **tags):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class NullTracer:
+    """Tracer that records nothing; span() hands out one shared no-op context manager"""
+    enabled = False
+
+    def span(self, name, **tags):
+        return _NULL_SPAN
+
+    def records(self):
+        return []
+
+    def summary(self):
+        return {}
+
+
+NULL_TRACER = NullTracer()
+
+
+class Tracer:
+    enabled = True
+
+    def __init__(self, memory=True, max_spans=100_000, memory_interval=0.01):
+        """
+        Collect timed spans of pipeline stages and model calls
+
+        Spans nest per thread or asyncio task: a span opened inside another
+        one inherits its tags (e.g. the page number), so spans opened by the
+        models are attributed to the page the pipeline is working on.
+
+        Args:
+            memory: Record per span the highest process RSS sampled while it was
+                open (peak_rss_bytes) and its rise over the RSS at span start
+                (peak_rss_delta_bytes), the RSS at span end and its change
+                since the start (rss_bytes, rss_delta_bytes: the memory the
+                stage kept), and the lifetime peak RSS of the process
+                (process_peak_rss_bytes)
+            max_spans: Number of finished spans kept, older ones are dropped
+            memory_interval: Seconds between RSS samples while spans are open;
+                shorter peaks than this can be missed
+        """
+        self.memory = memory
+        self._sampler = RssSampler(memory_interval) if memory else None
+        self._spans = deque(maxlen=max_spans)
+        self._lock = threading.Lock()
+
+    def span(self, name, **tags):
+        """
+        Time a block of work
+
+        Args:
+            name: Stage name, e.g. 'ocr' or 'layout.forward'
+            **tags: Attributes of the span, e.g. page=3
+
+        Returns:
+            Context manager yielding the Span, whose set() adds tags later
+        """
+        return Span(self, name, tags)
+
+    def _finish(self, span, exc_type):
+        record = {
+            "name": span.name,
+            "parent": span.parent,
+            "start_ns": span.start,
+            "duration_s": span.duration,
+            "thread": threading.current_thread().name,
+            "tags": span.tags
+        }
+        if exc_type is not None:
+            record["error"] = exc_type.__name__
+        if self.memory:
+            rss = current_rss()
+            peak = max(span.rss_peak, rss)
+            record["peak_rss_bytes"] = peak
+            record["peak_rss_delta_bytes"] = peak - span.rss_start
+            record["rss_bytes"] = rss
+            record["rss_delta_bytes"] = rss - span.rss_start
+            # ru_maxrss covers the whole process lifetime, not this span
+            record["process_peak_rss_bytes"] = peak_rss()
+        with self._lock:
+            self._spans.append(record)
+
+    def records(self):
+        """Finished spans as dictionaries, in completion order"""
+        with self._lock:
+            return list(self._spans)
+
+    def reset(self):
+        with self._lock:
+            self._spans.clear()
+
+    def summary(self):
+        """
+        Aggregate finished spans per stage name
+
+        Returns:
+            Dictionary of stage name to count, total and p50/p95/p99/max
+            seconds, highest process RSS sampled during a span of the stage,
+            the largest rise of RSS within one span, and summed token counts
+        """
+        stages = {}
+        for record in self.records():
+            stage = stages.setdefault(record["name"], {"durations": [], "rss": 0, "rss_rise": 0, "errors": 0,
+                                                       "tokens": {}})
+            stage["durations"].append(record["duration_s"])
+            stage["rss"] = max(stage["rss"], record.get("peak_rss_bytes", 0))
+            stage["rss_rise"] = max(stage["rss_rise"], record.get("peak_rss_delta_bytes", 0))
+            stage["errors"] += "error" in record
+            for tag, value in record["tags"].items():
+                if tag.endswith("_tokens") and isinstance(value, (int, float)):
+                    stage["tokens"][tag] = stage["tokens"].get(tag, 0) + value
+
+        summary = {}
+        for name, stage in stages.items():
+            durations = stage["durations"]
+            summary[name] = {
+                "count": len(durations),
+                "errors": stage["errors"],
+                "total_s": sum(durations),
+                "p50_s": percentile(durations, 50),
+                "p95_s": percentile(durations, 95),
+                "p99_s": percentile(durations, 99),
+                "max_s": max(durations),
+                "max_rss_bytes": stage["rss"],
+                "peak_rss_delta_bytes": stage["rss_rise"],
+                **stage["tokens"]
+            }
+        return summary
+
+    def write_jsonl(self, path):
+        """Append every finished span to a JSON lines file"""
+        with open(path, "a", encoding="utf-8") as f:
+            for record in self.records():
+                f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+
+    def prometheus_text(self, prefix="docpipe"):
+        """
+        Render the per-stage summary in the Prometheus text exposition format
+
+        Args:
+            prefix: Metric name prefix
+
+        Returns:
+            String with one summary metric for stage latency, plus RSS and
+            token metrics
+        """
+        summary = self.summary()
+        lines = [
+            f"# HELP {prefix}_stage_seconds Time spent per pipeline stage",
+            f"# TYPE {prefix}_stage_seconds summary"
+        ]
+        for name, stage in sorted(summary.items()):
+            for quantile in ("50", "95", "99"):
+                lines.append(f'{prefix}_stage_seconds{{stage="{name}",quantile="0.{quantile}"}} '
+                             f'{stage[f"p{quantile}_s"]:.6f}')
+            lines.append(f'{prefix}_stage_seconds_sum{{stage="{name}"}} {stage["total_s"]:.6f}')
+            lines.append(f'{prefix}_stage_seconds_count{{stage="{name}"}} {stage["count"]}')
+
+        lines += [
+            f"# HELP {prefix}_stage_errors_total Spans that ended with an exception",
+            f"# TYPE {prefix}_stage_errors_total counter"
+        ]
+        lines += [f'{prefix}_stage_errors_total{{stage="{name}"}} {stage["errors"]}'
+                  for name, stage in sorted(summary.items())]
+
+        if self.memory:
+            lines += [
+                f"# HELP {prefix}_stage_max_rss_bytes Highest process RSS sampled during a stage span",
+                f"# TYPE {prefix}_stage_max_rss_bytes gauge"
+            ]
+            lines += [f'{prefix}_stage_max_rss_bytes{{stage="{name}"}} {stage["max_rss_bytes"]}'
+                      for name, stage in sorted(summary.items())]
+            lines += [
+                f"# HELP {prefix}_stage_peak_rss_delta_bytes Largest rise of RSS within one span of a stage",
+                f"# TYPE {prefix}_stage_peak_rss_delta_bytes gauge"
+            ]
+            lines += [f'{prefix}_stage_peak_rss_delta_bytes{{stage="{name}"}} {stage["peak_rss_delta_bytes"]}'
+                      for name, stage in sorted(summary.items())]
+
+        token_lines = [
+            f'{prefix}_tokens_total{{stage="{name}",kind="{tag[:-len("_tokens")]}"}} {value}'
+            for name, stage in sorted(summary.items())
+            for tag, value in sorted(stage.items()) if tag.endswith("_tokens")
+        ]
+        if token_lines:
+            lines += [
+                f"# HELP {prefix}_tokens_total LLM tokens used",
+                f"# TYPE {prefix}_tokens_total counter"
+            ] + token_lines
+
+        return "\n".join(lines) + "\n"